@@ -0,0 +1,102 @@
+''' On-disk cache of Enroll responses, keyed by url.
+ Bodies are stored one file per url next to an index.json holding each url's ETag,
+ Last-Modified, fetch time and last use. Entries younger than ttl are served without
+ touching the network; older entries are revalidated with a conditional GET. The cache is
+ kept under max_bytes by evicting the least recently used bodies.
+ '''
+import atomic_file
+import threading
+import hashlib
+import time
+import json
+import os
+
+''' Raised in offline mode when a url was never cached, since there is no network to fall back on.
+'''
+class OfflineError(Exception):
+	pass
+
+
+class ResponseCache(object):
+	def __init__(self, directory = '.enroll_cache', ttl = 24 * 3600, max_bytes = 200 * 1024 * 1024, offline = False):
+		self.directory = directory
+		self.ttl = ttl
+		self.max_bytes = max_bytes
+		self.offline = offline
+		self.lock = threading.RLock()
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		self.index_path = os.path.join(directory, 'index.json')
+		self.index = {}
+		if os.path.exists(self.index_path):
+			with open(self.index_path) as fp:
+				self.index = json.load(fp)
+
+	def _body_path(self, url):
+		return os.path.join(self.directory, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.html')
+
+	def _save_index(self):
+		atomic_file.write_json(self.index_path, self.index)
+
+	''' Returns (body, entry) for a cached url, or None. Marks the entry as recently used.
+	'''
+	def lookup(self, url):
+		with self.lock:
+			entry = self.index.get(url)
+			if entry is None:
+				return None
+			try:
+				with open(self._body_path(url), 'rb') as fp:
+					body = fp.read().decode('utf-8')
+			except IOError:
+				del self.index[url]
+				return None
+			entry['used'] = time.time()
+			return body, entry
+
+	def is_fresh(self, entry):
+		return self.offline or time.time() - entry['fetched'] < self.ttl
+
+	''' Headers that let the server answer 304 Not Modified if the page hasn't changed.
+	'''
+	def conditional_headers(self, entry):
+		headers = {}
+		if entry.get('etag'):
+			headers['If-None-Match'] = entry['etag']
+		if entry.get('last_modified'):
+			headers['If-Modified-Since'] = entry['last_modified']
+		return headers
+
+	def store(self, url, body, headers):
+		data = body.encode('utf-8')
+		with self.lock:
+			with open(self._body_path(url), 'wb') as fp:
+				fp.write(data)
+			now = time.time()
+			self.index[url] = {'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified'),
+								'fetched': now, 'used': now, 'size': len(data)}
+			self._evict()
+			self._save_index()
+
+	''' Called on 304 Not Modified: the cached body is still good for another ttl.
+	'''
+	def revalidated(self, url):
+		with self.lock:
+			self.index[url]['fetched'] = time.time()
+			self._save_index()
+
+	def _evict(self):
+		total = sum(entry['size'] for entry in self.index.values())
+		for url, entry in sorted(self.index.items(), key = lambda item : item[1]['used']):
+			if total <= self.max_bytes:
+				break
+			total -= entry['size']
+			del self.index[url]
+			try:
+				os.remove(self._body_path(url))
+			except OSError:
+				pass
+
+	def flush(self):
+		with self.lock:
+			self._save_index()
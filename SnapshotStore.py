@@ -0,0 +1,147 @@
+''' Enrollment snapshots for a term that is polled repeatedly during registration.
+ Each poll appends one record to snapshots_<term>.ndjson: a full checkpoint of every
+ course's [registered, size] every checkpoint_every polls, and in between a delta holding
+ only the courses whose numbers changed (plus any that disappeared). A poll where nothing
+ changed writes nothing. snapshots_<term>.index.json keeps each record's time and byte
+ offset, so the state at any time is rebuilt by seeking to the checkpoint before it and
+ replaying the few deltas after it.
+ '''
+from bisect import bisect_right
+import atomic_file
+import json
+import time
+import os
+
+
+''' Registered/size values as ints where Enroll gives numbers, as strings otherwise.
+'''
+def Enrollment_Value(value):
+	try:
+		return int(value)
+	except (TypeError, ValueError):
+		return value
+
+
+class SnapshotStore(object):
+	def __init__(self, term, directory = '.', checkpoint_every = 48):
+		self.term = term
+		self.checkpoint_every = checkpoint_every
+		base = os.path.join(directory, 'snapshots_' + term)
+		self.log_path = base + '.ndjson'
+		self.index_path = base + '.index.json'
+		self.index = {'times': [], 'offsets': [], 'checkpoints': [], 'end': 0, 'polls_since_checkpoint': 0, 'last_poll': None}
+		if os.path.exists(self.index_path):
+			with open(self.index_path) as fp:
+				self.index = json.load(fp)
+		# Anything past the last indexed record was written by a poll that never finished
+		self.end = self._record_end(len(self.index['offsets']) - 1) if self.index['offsets'] else 0
+		self.state = self.State_As_Of(float('inf'))
+
+	def _record_end(self, i):
+		if i + 1 < len(self.index['offsets']):
+			return self.index['offsets'][i + 1]
+		return self.index['end']
+
+	def _save_index(self):
+		atomic_file.write_json(self.index_path, self.index)
+
+	''' Appends a record at time now, syncs it, and only then indexes it.
+	'''
+	def _append(self, record, now, checkpoint):
+		with open(self.log_path, 'ab') as out:
+			out.truncate(self.end)
+			out.seek(self.end)
+			out.write(json.dumps(record) + '\n')
+			out.flush()
+			os.fsync(out.fileno())
+			end = out.tell()
+		if checkpoint:
+			self.index['checkpoints'].append(len(self.index['offsets']))
+		self.index['times'].append(now)
+		self.index['offsets'].append(self.end)
+		self.index['end'] = self.end = end
+
+	''' Records one poll of the term's courses (dicts as scraped). Returns the number of
+	courses whose registered/size changed since the previous poll.
+	'''
+	def Record(self, courses, now = None):
+		now = time.time() if now is None else now
+		current = {}
+		for course in courses:
+			current[course['course_num']] = [Enrollment_Value(course.get('registered')), Enrollment_Value(course.get('size'))]
+		changes = dict((key, value) for key, value in current.items() if self.state.get(key) != value)
+		removed = [key for key in self.state if key not in current]
+
+		if not self.index['checkpoints'] or self.index['polls_since_checkpoint'] >= self.checkpoint_every:
+			self._append({'time': now, 'checkpoint': current}, now, True)
+			self.index['polls_since_checkpoint'] = 0
+		elif changes or removed:
+			self._append({'time': now, 'changes': changes, 'removed': removed}, now, False)
+		self.index['polls_since_checkpoint'] += 1
+		self.index['last_poll'] = now
+		self._save_index()
+		self.state = current
+		return len(changes) + len(removed)
+
+	''' Parsed records first through last (inclusive), read in one pass from the log.
+	'''
+	def _records(self, first, last):
+		if last < first:
+			return []
+		start, end = self.index['offsets'][first], self._record_end(last)
+		with open(self.log_path, 'rb') as fp:
+			fp.seek(start)
+			return [json.loads(line) for line in fp.read(end - start).splitlines()]
+
+	''' Returns {course_num: [registered, size]} as of time t: the last checkpoint at or
+	before t with every later delta up to t applied. Empty before the first poll.
+	'''
+	def State_As_Of(self, t):
+		last = bisect_right(self.index['times'], t) - 1
+		if last < 0:
+			return {}
+		checkpoints = self.index['checkpoints']
+		first = checkpoints[bisect_right(checkpoints, last) - 1]
+		state = {}
+		for record in self._records(first, last):
+			if 'checkpoint' in record:
+				state = record['checkpoint']
+			else:
+				state.update(record['changes'])
+				for key in record['removed']:
+					state.pop(key, None)
+		return state
+
+	''' Returns [(time, registered, size)] for one course: its value at start (if it was
+	listed then) and one entry per change up to end. registered and size are None while
+	the course was not listed.
+	'''
+	def Series(self, course_num, start = None, end = None):
+		times = self.index['times']
+		last = bisect_right(times, end) - 1 if end is not None else len(times) - 1
+		first = 0
+		if start is not None and bisect_right(times, start) > 0:
+			# Begin from the checkpoint before start, so the value at start is known
+			checkpoints = self.index['checkpoints']
+			first = checkpoints[bisect_right(checkpoints, bisect_right(times, start) - 1) - 1]
+		series, value, started = [], None, start is None
+		for record in self._records(first, last):
+			if not started and record['time'] > start:
+				started = True
+				if value is not None:
+					series.append((start, value[0], value[1]))
+			if 'checkpoint' in record:
+				new = record['checkpoint'].get(course_num)
+			elif course_num in record['changes']:
+				new = record['changes'][course_num]
+			elif course_num in record['removed']:
+				new = None
+			else:
+				continue
+			if new != value:
+				value = new
+				if started:
+					series.append((record['time'], value[0] if value else None, value[1] if value else None))
+		if not started and value is not None:
+			series.append((start, value[0], value[1]))
+		return series
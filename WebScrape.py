@@ -2,12 +2,156 @@
  Scrapes data from Carleton Enroll website containing course schedule information.
  '''
 from collections import defaultdict
-from bs4 import BeautifulSoup
+from multiprocessing.pool import ThreadPool
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.adapters import HTTPAdapter
+import ScrapeCache
+import atomic_file
+import SnapshotStore
+import instrument
 import requests
+import threading
+import urlparse
+import random
+import time
 import re
 import csv
 import sys
 import json
+import os
+
+# Homepage of the Enroll website; term and subject listings hang off this url
+ENROLL_URL = 'https://apps.carleton.edu/campus/registrar/schedule/enroll/'
+
+# Parser backend for Enroll subject pages, see Parse_Course_Page. 'lxml' is several times
+# faster than 'html5lib' and produces the same course dicts; it needs lxml installed.
+try:
+	import lxml
+	PARSER = 'lxml'
+except ImportError:
+	PARSER = 'html5lib'
+
+# Number of pages fetched at once when scraping concurrently
+MAX_WORKERS = 8
+
+# Most requests per second we will send to any single host
+REQUESTS_PER_SECOND = 10.0
+
+# Failed requests are retried with exponential backoff: BACKOFF, 2 * BACKOFF, 4 * BACKOFF...
+MAX_RETRIES = 4
+BACKOFF = 0.5
+TIMEOUT = 30
+
+
+''' Keeps requests to each host under REQUESTS_PER_SECOND. Worker threads call wait()
+before every request and are spaced out evenly, so a burst of workers can't hammer Enroll.
+'''
+class RateLimiter(object):
+	def __init__(self, rate):
+		self.rate = rate
+		self.lock = threading.Lock()
+		self.next_slot = defaultdict(float)
+
+	def wait(self, host):
+		if not self.rate:
+			return
+		with self.lock:
+			now = time.time()
+			slot = max(now, self.next_slot[host])
+			self.next_slot[host] = slot + 1.0 / self.rate
+		if slot > now:
+			time.sleep(slot - now)
+
+_session = None
+_session_lock = threading.Lock()
+_limiter = RateLimiter(REQUESTS_PER_SECOND)
+
+# Response cache shared by every fetch; None until Use_Cache is called
+cache = None
+
+# Last homepage fetched and its parse tree, so Academic_Term and Subject share one parse
+_homepage = (None, None)
+
+
+''' Returns a requests Session shared by every fetch. The session keeps a pool of
+keep-alive connections large enough for MAX_WORKERS threads, so pages after the first
+don't pay for a new TCP/TLS handshake.
+'''
+def Session():
+	global _session
+	with _session_lock:
+		if _session is None:
+			_session = requests.Session()
+			adapter = HTTPAdapter(pool_connections = 4, pool_maxsize = MAX_WORKERS)
+			_session.mount('http://', adapter)
+			_session.mount('https://', adapter)
+		return _session
+
+
+''' Turns on the on-disk response cache for every later fetch. With offline = True the
+scraper replays cached pages only and never touches the network.
+'''
+def Use_Cache(directory = '.enroll_cache', ttl = 24 * 3600, max_bytes = 200 * 1024 * 1024, offline = False):
+	global cache
+	cache = ScrapeCache.ResponseCache(directory, ttl, max_bytes, offline)
+	return cache
+
+
+''' Returns the text of the page at url. Connection errors, timeouts and 429/5xx
+responses are retried up to MAX_RETRIES times with jittered exponential backoff.
+When the cache is on, fresh pages come straight from disk and stale ones are
+revalidated with their ETag/Last-Modified.
+'''
+def Fetch(url):
+	with instrument.span('scrape.fetch'):
+		headers = {}
+		if cache is not None:
+			cached = cache.lookup(url)
+			if cached is not None:
+				body, entry = cached
+				if cache.is_fresh(entry):
+					return body
+				headers = cache.conditional_headers(entry)
+			elif cache.offline:
+				raise ScrapeCache.OfflineError('not in cache: ' + url)
+
+		host = urlparse.urlparse(url).netloc
+		for attempt in range(MAX_RETRIES + 1):
+			_limiter.wait(host)
+			try:
+				response = Session().get(url, headers = headers, timeout = TIMEOUT)
+				if response.status_code == 304 and cache is not None:
+					cache.revalidated(url)
+					return body
+				if response.status_code != 429 and response.status_code < 500:
+					response.raise_for_status()
+					if cache is not None:
+						cache.store(url, response.text, response.headers)
+					return response.text
+				error = requests.HTTPError('%d for url: %s' % (response.status_code, url), response = response)
+			except (requests.ConnectionError, requests.Timeout) as e:
+				error = e
+			if attempt == MAX_RETRIES:
+				raise error
+			time.sleep(BACKOFF * 2 ** attempt * (0.5 + random.random()))
+
+
+''' Returns the parse tree of the Enroll homepage. The page is only reparsed when its
+html has changed since the last call.
+'''
+def Homepage():
+	global _homepage
+	html_enroll = Fetch(ENROLL_URL)
+	if _homepage[0] != html_enroll:
+		_homepage = (html_enroll, BeautifulSoup(html_enroll, 'html5lib'))
+	return _homepage[1]
+
+
+''' Returns the Enroll link listing the courses for one subject in one term.
+Example: 'https://apps.carleton.edu/campus/registrar/schedule/enroll/?term=18WI&subject=CS'
+'''
+def Subject_URL(term, subject):
+	return ENROLL_URL + '?term=' + term + '&subject=' + subject
 
 ''' Returns list of academic terms that user can choose from. Item in list
 will be passed to function that returns html link with term info provided.
@@ -15,8 +159,7 @@ Example: 'term=18WI' in 'https://apps.carleton.edu/campus/registrar/schedule/enr
 '''
 def Academic_Term():
 	# Homepage showing listings of academic terms and course subjects
-	html_enroll = requests.get('https://apps.carleton.edu/campus/registrar/schedule/enroll/').text
-	soup2 = BeautifulSoup(html_enroll, 'html5lib')
+	soup2 = Homepage()
 
 	# Tag object containing list of academic terms 
 	term_summary = soup2.find("select", id = "termElement")
@@ -37,8 +180,7 @@ appropriate html link which contains specific course information for the subject
 Example: 'subject=CS' in 'https://apps.carleton.edu/campus/registrar/schedule/enroll/?term=18WI&subject=CS'
 '''
 def Subject(): 
-	html_enroll = requests.get('https://apps.carleton.edu/campus/registrar/schedule/enroll/').text
-	soup2 = BeautifulSoup(html_enroll, 'html5lib')
+	soup2 = Homepage()
 
 
 	# Tag object containing list of subjects
@@ -68,92 +210,214 @@ def Subject():
 
 
 
+''' Returns list of course dicts scraped from one Enroll subject page. Related courses
+from other departments listed on the page are skipped. parser picks the backend:
+'html5lib' builds the full page tree, 'lxml' only builds the div.course nodes.
+'''
+def Parse_Course_Page(html, term, subject, parser = None):
+	with instrument.span('scrape.parse') as span:
+		if (parser or PARSER) == 'lxml':
+			page_courses = Parse_Course_Page_Lxml(html, term, subject)
+		else:
+			page_courses = Parse_Course_Page_Html5lib(html, term, subject)
+		span.items = len(page_courses)
+	return page_courses
+
+
+''' Original parser: html5lib tree of the whole page, one find() per field.
+'''
+def Parse_Course_Page_Html5lib(html, term, subject):
+	# Courses listed on this page, in page order
+	page_courses = []
+
+	soup = BeautifulSoup(html, 'html5lib')
+
+	# Creates list of all items with course as class attribute, excluding related courses
+	course_summary = soup.find_all("div", class_="course")
+	for course in course_summary:
+		course_num = course.find(class_= "coursenum").get_text()
+		# Finds title attribute within each course
+		title = course.find(class_ = "title").get_text()
+		# Only takes the actual name of the course
+		# which is next to the coursenum attribute but not within its own tag
+		for item in title:
+			course_name = course.find(class_= "coursenum").next_sibling	
+
+		# Add info to list associated with key
+		specific_info = {}
+		# Ensures that no related courses are added
+		if course_num.find(subject) > -1:
+			specific_info['department'] = subject
+			specific_info['term'] = term
+			specific_info['course_num'] = course_num
+			specific_info['title'] = course_name
+			if course.find(class_ = "faculty") != None:
+				faculty = course.find(class_ = "faculty").get_text()
+				specific_info['faculty'] = faculty
+				if course.find(class_ ="faculty").next_sibling != None:
+						summary = course.find(class_ = "faculty").next_sibling
+						summary = summary.encode("utf-8")
+						specific_info['summary'] = summary
+				else:
+						specific_info['summary'] = "n/a"
+			else:
+				specific_info['faculty'] = "n/a"
+			if course.find(class_ = "status") != None:
+				enrollment = course.find(class_ = "status").get_text()
+				# specific_info['enrollment'] = enrollment
+				registered = re.findall(r'(?<=Registered: ).*?(?=\,)', enrollment)[0]
+				size = re.findall(r'(?<=Size: ).*?(?=\,)', enrollment)[0]
+				# print registered
+				specific_info['registered'] = registered
+				specific_info['size'] = size
+				# print enrollment
+			else:
+				specific_info['registered'] = "n/a"
+				specific_info['size'] = "n/a"
+			if course.find(class_ = "credits") != None:
+				credits = course.find(class_ = "credits").get_text()
+				specific_info['credits'] = credits
+			else:
+				specific_info['credits'] = "n/a"
+			if course.find(class_ = "codes overlays"):
+				requirements = course.find(class_ = "codes overlays").get_text()
+				specific_info['requirements_met'] = requirements
+
+
+			# course_info[0].append({})	
+			# Start and end times for courses that have set times
+			# Account for classes without set times
+			if course.find(class_ = "start") != None:
+				start_time = course.find("span", {"class": "start"}).get_text()
+				end_time = course.find(class_ = "end").get_text()
+				specific_info['start_time'] = start_time
+				specific_info['end_time'] = end_time
+
+			else:
+				specific_info['start_time'] = "n/a"
+				specific_info['end_time'] = "n/a"
+				# course_info[0][0].append(start_time)
+			page_courses.append(specific_info)
+	return page_courses
+
+
+''' Fast parser: lxml builds only the div.course subtrees, and each course's tags are
+walked once to pick up every field. Mirrors Parse_Course_Page_Html5lib field for field.
+'''
+def Parse_Course_Page_Lxml(html, term, subject):
+	page_courses = []
+	course_name = None
+
+	soup = BeautifulSoup(html, 'lxml', parse_only = SoupStrainer("div", class_ = "course"))
+	for course in soup.find_all("div", class_ = "course"):
+		# First tag for each class name (and each full class attribute, e.g. "codes overlays"),
+		# which is what course.find(class_ = ...) would return
+		first = {}
+		start_span = None
+		for tag in course.find_all(True):
+			classes = tag.get("class")
+			if not classes:
+				continue
+			for name in classes + [" ".join(classes)]:
+				if name not in first:
+					first[name] = tag
+			if start_span is None and tag.name == "span" and "start" in classes:
+				start_span = tag
+
+		course_num = first["coursenum"].get_text()
+		# Only takes the actual name of the course, which is next to the coursenum attribute
+		if first["title"].get_text():
+			course_name = first["coursenum"].next_sibling
+
+		# Ensures that no related courses are added
+		if course_num.find(subject) == -1:
+			continue
+		specific_info = {}
+		specific_info['department'] = subject
+		specific_info['term'] = term
+		specific_info['course_num'] = course_num
+		specific_info['title'] = course_name
+		faculty = first.get("faculty")
+		if faculty is not None:
+			specific_info['faculty'] = faculty.get_text()
+			if faculty.next_sibling is not None:
+				specific_info['summary'] = faculty.next_sibling.encode("utf-8")
+			else:
+				specific_info['summary'] = "n/a"
+		else:
+			specific_info['faculty'] = "n/a"
+		status = first.get("status")
+		if status is not None:
+			enrollment = status.get_text()
+			specific_info['registered'] = re.findall(r'(?<=Registered: ).*?(?=\,)', enrollment)[0]
+			specific_info['size'] = re.findall(r'(?<=Size: ).*?(?=\,)', enrollment)[0]
+		else:
+			specific_info['registered'] = "n/a"
+			specific_info['size'] = "n/a"
+		if "credits" in first:
+			specific_info['credits'] = first["credits"].get_text()
+		else:
+			specific_info['credits'] = "n/a"
+		if "codes overlays" in first:
+			specific_info['requirements_met'] = first["codes overlays"].get_text()
+		# Account for classes without set times
+		if "start" in first:
+			specific_info['start_time'] = start_span.get_text()
+			specific_info['end_time'] = first["end"].get_text()
+		else:
+			specific_info['start_time'] = "n/a"
+			specific_info['end_time'] = "n/a"
+		page_courses.append(specific_info)
+	return page_courses
+
+
+''' Returns the courses on the page for one (term, subject) pair.
+'''
+def Scrape_Page(page):
+	term, subject = page
+	# Course listings for subject during term provided
+	html = Fetch(Subject_URL(term, subject))
+	return Parse_Course_Page(html, term, subject)
+
+
 ''' Returns dict object with course number, course name, and start/end times for each course
 Finds course info based on the academic term and subject chosen (in this case, Winter 2018)
+With workers > 1 the subject pages are fetched concurrently over the shared connection pool;
+the output is the same as the sequential scrape since courses are kept in subject order.
 '''
+def Specific_Course_Info(term, workers = 1, filename_pattern = 'course_data_%s.json'):
+	return Scrape_Terms([term], workers, filename_pattern)[term]
 
-def Specific_Course_Info(term):
-	# Creates dict object with course number as key and list containing name and times for course as values
-	course_info = defaultdict(list)
 
+''' Scrapes every (term, subject) page for the given terms at once, up to workers pages
+in flight, and writes course_data_<term>.json for each term (nothing is written if
+filename_pattern is None). Returns dict of term -> course info.
+'''
+def Scrape_Terms(terms, workers = MAX_WORKERS, filename_pattern = 'course_data_%s.json'):
 	subjects = Subject()
+	pages = [(term, subject) for term in terms for subject in subjects]
+
+	if workers > 1:
+		pool = ThreadPool(workers)
+		try:
+			page_courses = pool.map(Scrape_Page, pages, chunksize = 1)
+		except BaseException:
+			# Drop the queued fetches rather than keep hitting Enroll for a failed run
+			pool.terminate()
+			raise
+		pool.close()
+	else:
+		page_courses = map(Scrape_Page, pages)
 
-	for subject in subjects:
-		html_string = 'https://apps.carleton.edu/campus/registrar/schedule/enroll/?term=' + term + '&subject=' + subject
-
-		# Course listings for subject during term provided
-		html = requests.get(html_string).text
-
-		soup = BeautifulSoup(html, 'html5lib')
-
-		# Creates list of all items with course as class attribute, excluding related courses
-		course_summary = soup.find_all("div", class_="course")
-		for course in course_summary:
-			course_num = course.find(class_= "coursenum").get_text()
-			# Finds title attribute within each course
-			title = course.find(class_ = "title").get_text()
-			# Only takes the actual name of the course
-			# which is next to the coursenum attribute but not within its own tag
-			for item in title:
-				course_name = course.find(class_= "coursenum").next_sibling	
-
-			# Add info to list associated with key
-			specific_info = {}
-			# Ensures that no related courses are added
-			if course_num.find(subject) > -1:
-				specific_info['department'] = subject
-				specific_info['term'] = term
-				specific_info['course_num'] = course_num
-				specific_info['title'] = course_name
-				if course.find(class_ = "faculty") != None:
-					faculty = course.find(class_ = "faculty").get_text()
-					specific_info['faculty'] = faculty
-					if course.find(class_ ="faculty").next_sibling != None:
-							summary = course.find(class_ = "faculty").next_sibling
-							summary = summary.encode("utf-8")
-							specific_info['summary'] = summary
-					else:
-							specific_info['summary'] = "n/a"
-				else:
-					specific_info['faculty'] = "n/a"
-				if course.find(class_ = "status") != None:
-					enrollment = course.find(class_ = "status").get_text()
-					# specific_info['enrollment'] = enrollment
-					registered = re.findall(r'(?<=Registered: ).*?(?=\,)', enrollment)[0]
-					size = re.findall(r'(?<=Size: ).*?(?=\,)', enrollment)[0]
-					# print registered
-					specific_info['registered'] = registered
-					specific_info['size'] = size
-					# print enrollment
-				else:
-					specific_info['registered'] = "n/a"
-					specific_info['size'] = "n/a"
-				if course.find(class_ = "credits") != None:
-					credits = course.find(class_ = "credits").get_text()
-					specific_info['credits'] = credits
-				else:
-					specific_info['credits'] = "n/a"
-				if course.find(class_ = "codes overlays"):
-					requirements = course.find(class_ = "codes overlays").get_text()
-					specific_info['requirements_met'] = requirements
-
-
-				# course_info[0].append({})	
-				# Start and end times for courses that have set times
-				# Account for classes without set times
-				if course.find(class_ = "start") != None:
-					start_time = course.find("span", {"class": "start"}).get_text()
-					end_time = course.find(class_ = "end").get_text()
-					specific_info['start_time'] = start_time
-					specific_info['end_time'] = end_time
+	# Creates dict object with course number as key and list containing name and times for course as values
+	results = {}
+	for term in terms:
+		results[term] = defaultdict(list)
+	for (term, subject), courses in zip(pages, page_courses):
+		results[term]['course_info'].extend(courses)
+	if cache is not None:
+		cache.flush()
 
-				else:
-					specific_info['start_time'] = "n/a"
-					specific_info['end_time'] = "n/a"
-					# course_info[0][0].append(start_time)
-				course_info['course_info'].append(specific_info)
-					# course_info[0][0].append(end_time)
-	
 	# Creates csv file with course info
 	# with open('course_info7.csv', 'w') as f: 
 	# 	w = csv.DictWriter(f, course_info.keys())
@@ -167,10 +431,112 @@ def Specific_Course_Info(term):
 	# 	writer.writerow(course_row)
 	# output_file.close()
 	# print course_info
-	filename = 'course_data_' + term + '.json'
-	with open(filename, 'w') as fp:
+	if filename_pattern:
+		for term, course_info in results.items():
+			with open(filename_pattern % term, 'w') as fp:
+				json.dump(course_info, fp)
+	return results
+
+
+def Scrape_Page_Pair(page):
+	return page, Scrape_Page(page)
+
+
+''' Replaces the manifest atomically, so the checkpoint on disk is always either the old
+one or the new one.
+'''
+def Save_Manifest(manifest, path):
+	atomic_file.write_json(path, manifest)
+
+
+''' Scrapes one term, appending each course to course_data_<term>.ndjson as soon as its
+subject page is parsed. After each subject the file is synced and the checkpoint manifest
+course_data_<term>.manifest.json records the subject's byte range. If the scrape is
+interrupted, running it again truncates any half-written subject and scrapes only the
+subjects missing from the manifest. Finishes by compacting into course_data_<term>.json.
+'''
+def Stream_Term(term, workers = MAX_WORKERS, directory = '.'):
+	base = os.path.join(directory, 'course_data_' + term)
+	manifest_path = base + '.manifest.json'
+	if os.path.exists(manifest_path):
+		with open(manifest_path) as fp:
+			manifest = json.load(fp)
+	else:
+		manifest = {'term': term, 'subjects': Subject(), 'done': {}, 'offset': 0}
+
+	missing = [(term, subject) for subject in manifest['subjects'] if subject not in manifest['done']]
+	pool = ThreadPool(workers)
+	with open(base + '.ndjson', 'ab') as out:
+		# Anything past the last checkpoint belongs to a subject that never finished
+		out.truncate(manifest['offset'])
+		out.seek(manifest['offset'])
+		try:
+			for (_, subject), courses in pool.imap_unordered(Scrape_Page_Pair, missing):
+				start = out.tell()
+				for course in courses:
+					out.write(json.dumps(course) + '\n')
+				out.flush()
+				os.fsync(out.fileno())
+				manifest['done'][subject] = [start, out.tell()]
+				manifest['offset'] = out.tell()
+				Save_Manifest(manifest, manifest_path)
+		except BaseException:
+			pool.terminate()
+			raise
+		pool.close()
+	if cache is not None:
+		cache.flush()
+	return Compact_Term(term, directory)
+
+
+''' Builds course_data_<term>.json ({"course_info": [...]}, subjects in homepage order) from
+a finished streaming scrape, so isaac.initialize_data can read it like any other term.
+'''
+def Compact_Term(term, directory = '.'):
+	base = os.path.join(directory, 'course_data_' + term)
+	with open(base + '.manifest.json') as fp:
+		manifest = json.load(fp)
+	missing = [subject for subject in manifest['subjects'] if subject not in manifest['done']]
+	if missing:
+		raise ValueError('scrape of %s is missing subjects: %s' % (term, ', '.join(missing)))
+
+	course_info = defaultdict(list)
+	with open(base + '.ndjson', 'rb') as records:
+		for subject in manifest['subjects']:
+			start, end = manifest['done'][subject]
+			records.seek(start)
+			for line in records.read(end - start).splitlines():
+				course_info['course_info'].append(json.loads(line))
+	with open(base + '.json', 'w') as fp:
 		json.dump(course_info, fp)
 	return course_info
+
+
+''' Scrapes the term once and records the courses whose registered/size changed since the
+last poll in the term's SnapshotStore (see SnapshotStore.py). Returns the number of
+changed courses. Polling with Use_Cache(ttl = 0) revalidates every page with a
+conditional GET, so unchanged subject pages cost a 304 instead of a download.
+'''
+def Poll_Term(term, store = None, workers = MAX_WORKERS, directory = '.'):
+	store = store or SnapshotStore.SnapshotStore(term, directory)
+	courses = Scrape_Terms([term], workers, None)[term]['course_info']
+	return store.Record(courses)
+
+
+''' Polls the term every interval seconds, polls times (forever if None).
+'''
+def Poll(term, interval = 3600, polls = None, workers = MAX_WORKERS, directory = '.'):
+	store = SnapshotStore.SnapshotStore(term, directory)
+	done = 0
+	while polls is None or done < polls:
+		started = time.time()
+		changed = Poll_Term(term, store, workers)
+		done += 1
+		print term, time.strftime('%Y-%m-%d %H:%M:%S'), changed, 'courses changed'
+		if polls is None or done < polls:
+			time.sleep(max(0, interval - (time.time() - started)))
+
+
 # ''' Adds lists together from Specific_Course_Info so that each csv file will contain info 
 # for ALL subjects in one term
 # ''' 
@@ -0,0 +1,115 @@
+from __future__ import division
+import json
+import os
+
+import numpy as np
+import atomic_file
+import groupby
+
+# Running enrollment sums and counts per group, maintained one term at a time.
+#
+# Each ingested term's contribution (sum of targets and number of courses per group key)
+# is saved in its own file, and totals.json holds the sums over every ingested term.
+# Ingesting a term folds only that term's courses into the totals; retracting it (say,
+# before a re-scrape is ingested) subtracts the saved contribution back out. Reports read
+# totals.json alone, so their cost depends on the number of distinct keys, not on how
+# many terms have been ingested.
+
+AGGREGATES_DIR = ".aggregates"
+
+# Grouping name -> function of the course_columns dict returning one key per course, or a
+# list of keys per course for multi-valued groupings
+GROUPINGS = {
+    "all": lambda columns : [None] * len(columns["department"]),
+    "department": lambda columns : columns["department"],
+    "distro": lambda columns : columns["distros"],
+    "start": lambda columns : columns["start"],
+    "duration": lambda columns : columns["duration"],
+    "faculty": lambda columns : columns["faculty"],
+    "title": lambda columns : zip(columns["department"], columns["title"]),
+}
+MULTI = {"distro"}
+
+
+# {grouping : {key : [sum, count]}} for one term. Keys are JSON-encoded so any key type
+# survives the round trip through the saved files.
+def contribution(columns, targets):
+    targets = np.asarray(targets, dtype = np.float64)
+    result = {}
+    for name, keys_of in GROUPINGS.items():
+        keys = keys_of(columns)
+        if name in MULTI:
+            rows, codes, order = groupby.encode_multi(keys)
+            values = targets[rows]
+        else:
+            codes, order = groupby.encode(keys)
+            values = targets
+        sums = np.bincount(codes, weights = values, minlength = len(order)).tolist() if len(codes) else []
+        counts = np.bincount(codes, minlength = len(order)).tolist() if len(codes) else []
+        result[name] = {json.dumps(key) : [total, count] for key, total, count in zip(order, sums, counts)}
+    return result
+
+
+class Aggregates(object):
+
+    def __init__(self, directory = AGGREGATES_DIR):
+        self.directory = directory
+        path = os.path.join(directory, "totals.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+        else:
+            state = {"terms": {}, "totals": {name : {} for name in GROUPINGS}}
+        # Term -> hash of the source it was ingested from
+        self.terms = state["terms"]
+        self.totals = state["totals"]
+
+    def _term_path(self, term):
+        return os.path.join(self.directory, "term_%s.json" % term)
+
+    def _write(self, path, data):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        atomic_file.write_json(path, data)
+
+    def save(self):
+        self._write(os.path.join(self.directory, "totals.json"), {"terms": self.terms, "totals": self.totals})
+
+    def _fold(self, term_groups, sign):
+        for name, groups in term_groups.items():
+            totals = self.totals[name]
+            for key, (total, count) in groups.items():
+                running = totals.setdefault(key, [0.0, 0])
+                running[0] += sign * total
+                running[1] += sign * count
+                if running[1] == 0:
+                    del totals[key]
+
+    # Folds one term's courses into the totals. A term that was already ingested from the
+    # same source is left alone; one ingested from a different source is retracted first.
+    # Returns whether anything changed.
+    def ingest(self, term, columns, targets, source_hash = None):
+        if term in self.terms:
+            if source_hash is not None and self.terms[term] == source_hash:
+                return False
+            self.retract(term)
+        term_groups = contribution(columns, targets)
+        self._write(self._term_path(term), term_groups)
+        self._fold(term_groups, 1)
+        self.terms[term] = source_hash
+        self.save()
+        return True
+
+    # Subtracts a previously ingested term back out of the totals
+    def retract(self, term):
+        if term not in self.terms:
+            raise ValueError("term %s has not been ingested" % term)
+        with open(self._term_path(term)) as f:
+            self._fold(json.load(f), -1)
+        os.remove(self._term_path(term))
+        del self.terms[term]
+        self.save()
+
+    # (key, mean, count) for every key of a grouping
+    def means(self, name):
+        return [(json.loads(key), total / count, count) for key, (total, count) in self.totals[name].items()]
@@ -0,0 +1,31 @@
+from contextlib import contextmanager
+import json
+import os
+
+# Files that are replaced whole (indexes, manifests, caches, saved models).
+#
+# The new contents go to <path>.tmp next to the target, which is renamed over the old
+# file only once it is completely written, so a crash mid-write leaves the old file or
+# the new one and never a truncated one. Windows can't rename over an existing file, so
+# there the old file is removed first.
+
+
+# Context manager giving a file to write the new contents of path to
+@contextmanager
+def replace(path, mode = "w"):
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, mode) as f:
+            yield f
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    if os.name == "nt" and os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp, path)
+
+
+def write_json(path, data):
+    with replace(path) as f:
+        json.dump(data, f)
@@ -0,0 +1,408 @@
+from __future__ import division
+import argparse
+import hashlib
+import json
+import sys
+import urlparse
+import time
+import os
+
+import requests
+import instrument
+import local_http
+import WebScrape
+
+# Saved Enroll pages live in one directory: the homepage as index.html and each
+# subject page as <term>_<subject>.html, e.g. 18WI_CS.html
+HOMEPAGE = "index.html"
+
+
+def page_filename(term, subject):
+    return "%s_%s.html" % (term, subject)
+
+
+# Downloads the Enroll homepage and every subject page for the given terms into directory,
+# so benchmarks can be rerun offline against the stub server
+def save_pages(terms, directory):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(os.path.join(directory, HOMEPAGE), "w") as f:
+        f.write(WebScrape.Fetch(WebScrape.ENROLL_URL).encode("utf-8"))
+    for term in terms:
+        for subject in WebScrape.Subject():
+            html = WebScrape.Fetch(WebScrape.Subject_URL(term, subject))
+            with open(os.path.join(directory, page_filename(term, subject)), "w") as f:
+                f.write(html.encode("utf-8"))
+
+
+# Serves saved Enroll pages from directory the way apps.carleton.edu would, adding
+# latency seconds to every response to stand in for the network round trip.
+# Returns the server and the url to use as WebScrape.ENROLL_URL.
+def serve_pages(directory, latency = 0.0):
+
+    class Handler(local_http.Handler):
+
+        def do_GET(self):
+            query = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+            if "term" in query and "subject" in query:
+                name = page_filename(query["term"][0], query["subject"][0])
+            else:
+                name = HOMEPAGE
+            path = os.path.join(directory, name)
+            time.sleep(latency)
+            if not os.path.exists(path):
+                self.send_error(404)
+                return
+            body = open(path, "rb").read()
+            etag = '"%s"' % hashlib.sha1(body).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                self.send(304)
+                return
+            self.send(200, body, "text/html; charset=utf-8", [("ETag", etag)])
+
+    server = local_http.make_server(Handler, background = True)
+    return server, "http://127.0.0.1:%d/" % server.server_address[1]
+
+
+# Terms with at least one saved subject page in directory
+def saved_terms(directory):
+    return sorted({name.split("_")[0] for name in os.listdir(directory) if name != HOMEPAGE})
+
+
+# Times the scraper against the stub server: the original one-requests.get-per-page loop,
+# the pooled sequential path and the concurrent path. Prints pages/sec for each.
+def bench_scrape(directory, workers = WebScrape.MAX_WORKERS, latency = .05, rate = 0):
+    server, url = serve_pages(directory, latency)
+    old_url, old_rate = WebScrape.ENROLL_URL, WebScrape._limiter.rate
+    WebScrape.ENROLL_URL, WebScrape._limiter.rate = url, rate
+    try:
+        terms = saved_terms(directory)
+        subjects = WebScrape.Subject()
+        num_pages = len(terms) * len(subjects)
+
+        def legacy():
+            for term in terms:
+                for subject in subjects:
+                    html = requests.get(WebScrape.Subject_URL(term, subject)).text
+                    WebScrape.Parse_Course_Page(html, term, subject)
+
+        runs = [("unpooled sequential (original)", legacy),
+                ("pooled sequential", lambda: WebScrape.Scrape_Terms(terms, 1, None)),
+                ("pooled, %d workers" % workers, lambda: WebScrape.Scrape_Terms(terms, workers, None))]
+
+        print "===== Scraper Throughput (%d pages, %.0f ms latency) =====\n" % (num_pages, latency * 1000)
+        for name, run in runs:
+            start = time.time()
+            run()
+            elapsed = time.time() - start
+            print "%-32s %7.2f s %8.1f pages/sec" % (name, elapsed, num_pages / elapsed)
+        print
+    finally:
+        WebScrape.ENROLL_URL, WebScrape._limiter.rate = old_url, old_rate
+        WebScrape.Session().close()
+        server.shutdown()
+        server.server_close()
+
+
+# Parses every saved subject page in directory with each parser backend, checks that
+# they produce identical course dicts and prints the time per page. Returns the number of
+# pages where any backend differs from the first.
+def bench_parse(directory, parsers = ("html5lib", "lxml")):
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        if name != HOMEPAGE:
+            term, subject = name[:-len(".html")].split("_", 1)
+            pages.append((term, subject, open(os.path.join(directory, name)).read().decode("utf-8")))
+
+    print "===== Parser Speed (%d pages) =====\n" % len(pages)
+    results, times = {}, {}
+    for parser in parsers:
+        start = time.time()
+        results[parser] = [WebScrape.Parse_Course_Page(html, term, subject, parser) for term, subject, html in pages]
+        times[parser] = time.time() - start
+    differing = 0
+    for parser in parsers:
+        mismatches = sum(1 for a, b in zip(results[parsers[0]], results[parser]) if a != b)
+        differing += mismatches
+        print "%-10s %8.2f ms/page %6.1fx  %d pages differ from %s" % (parser, times[parser] * 1000 / len(pages),
+                times[parsers[0]] / times[parser], mismatches, parsers[0])
+    print
+    return differing
+
+
+# Current resident set size of this process in bytes
+def resident_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+# Bytes held by obj and everything it references, counting shared objects once
+def deep_size(obj, seen = None):
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(obj.__dict__, seen)
+    return size
+
+
+# The exclusion filter initialize_data applied to each course before loader.RULES
+def _legacy_keep(course):
+    try:
+        for field in ["summary", "start_time", "end_time", "department", "requirements_met",
+                      "registered", "size", "faculty", "title"]:
+            if course[field] == "n/a":
+                return False
+        is_ai = "Argument & Inquiry Seminar" in course["requirements_met"].split("\n")
+        is_pe = course["department"] == "PE"
+        is_lab = "Lab" in course["title"] and course["department"] != "MUSC" and course["credits"][0] != "6"
+        return float(course["size"]) > 0 and not is_lab and not is_ai and not is_pe
+    except (KeyError, IndexError, ValueError):
+        return False
+
+
+# Loads the past terms in one representation and puts (courses, bytes held by the courses
+# and targets, resident bytes added) on queue
+def _load_resident(representation, source_dir, queue):
+    import gc
+    import course_store
+    import loader
+    # Warm up on one term so lazily imported modules and allocator arenas aren't counted
+    loader.load_term(course_store.source_files(source_dir)[0])
+    gc.collect()
+    before = resident_bytes()
+    if representation == "dicts":
+        # One dict per course from json.load and a list of floats, as initialize_data used
+        # to build them, so every course holds its own copy of each string
+        courses = []
+        for path in course_store.source_files(source_dir):
+            with open(path) as f:
+                courses.extend(course for course in json.load(f)["course_info"] if _legacy_keep(course))
+        targets = [float(course["registered"]) / float(course["size"]) for course in courses]
+    else:
+        courses, targets, _ = loader.load_terms(source_dir, processes = 1)
+    gc.collect()
+    queue.put((len(courses), deep_size((courses, targets)), resident_bytes() - before))
+
+
+# Memory per 10k courses for the past terms held as a list of dicts versus a CourseTable:
+# the bytes the objects themselves hold, and the growth in resident size (which also
+# counts garbage from loading that the allocator kept). Each representation is loaded in
+# a fresh child process.
+def bench_memory(source_dir):
+    from multiprocessing import Process, Queue
+    print "===== Course Memory (representation : courses : held MB / resident MB per 10k courses) =====\n"
+    for representation in ("dicts", "table"):
+        queue = Queue()
+        child = Process(target = _load_resident, args = (representation, source_dir, queue))
+        child.start()
+        count, held, added = queue.get()
+        child.join()
+        print "%-6s %6d %8.2f %8.2f" % (representation, count, held * 10000 / count / 2 ** 20, added * 10000 / count / 2 ** 20)
+    print
+
+
+# Checks schedule's time parsing against isaac.time_string_to_float over every time string
+# in the data, then times the schedule columns of the past terms: one parse per course
+# with the original function versus one per distinct string with schedule.columns.
+# Returns whether everything matched.
+def bench_schedule(source_dir = "Carleton Data - Past Terms"):
+    import isaac
+    import loader
+    import schedule
+    checked, mismatches = schedule.verify(isaac.time_string_to_float)
+    print "===== Time Parsing (%d time strings and start/end pairs checked) =====\n" % checked
+    for value, expected, got in mismatches:
+        print "MISMATCH", value, expected, got
+    courses, _, _ = loader.load_terms(source_dir, processes = 1)
+    start_times, end_times = courses.column("start_time"), courses.column("end_time")
+
+    def original():
+        starts = [isaac.time_string_to_float(start) for start in start_times]
+        return starts, [round(isaac.time_string_to_float(end) - start, 2) for end, start in zip(end_times, starts)]
+
+    start = time.time()
+    expected = original()
+    legacy_seconds = time.time() - start
+    start = time.time()
+    columns = schedule.columns(courses)
+    schedule_seconds = time.time() - start
+    columns_match = expected == (columns["start"], columns["duration"])
+    print "%d courses: time_string_to_float %.1f ms, schedule.columns %.1f ms, columns %s\n" % (
+        len(courses), legacy_seconds * 1000, schedule_seconds * 1000, "match" if columns_match else "DIFFER")
+    return columns_match and not mismatches
+
+
+# Cache files and directories the pipeline writes next to the data
+CACHES = [".course_store", ".feature_cache", ".keyword_index.json", ".sentiment_cache.json", ".aggregates"]
+SUITE_SCALES = [10, 100, 1000]
+
+
+# Runs the pipeline stages in directory (a synthetic dataset) and puts
+# [(stage, seconds, growth of peak resident bytes, items)] on queue
+def _run_stages(directory, queue):
+    import codecs
+    import shutil
+    os.chdir(directory)
+    for cache in CACHES:
+        if os.path.isdir(cache):
+            shutil.rmtree(cache)
+        elif os.path.exists(cache):
+            os.remove(cache)
+    import isaac
+    import cv
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.linear_model import LinearRegression
+
+    pages = []
+    if os.path.isdir("pages"):
+        for name in sorted(os.listdir("pages")):
+            if name != HOMEPAGE:
+                term, subject = name[:-len(".html")].split("_", 1)
+                pages.append((term, subject, open(os.path.join("pages", name)).read().decode("utf-8")))
+    shared = {}
+    models = {"Random Forest": RandomForestRegressor(n_estimators = 10), "Linear Regression": LinearRegression()}
+    stages = [("load", isaac.initialize_data, lambda : len(isaac.courses)),
+              ("analyze columns", lambda : shared.update(columns = isaac.analysis_columns()), lambda : len(isaac.courses))]
+    for section in isaac.ANALYZE_SECTIONS:
+        stages.append(("analyze " + section.__name__[len("analyze_"):], lambda section = section : section(shared["columns"]),
+                       lambda : len(isaac.courses)))
+    stages += [("feature matrix", lambda : shared.update(matrix = isaac.training_matrix()), lambda : len(isaac.courses)),
+               ("cross-validation", lambda : cv.cross_validate(shared["matrix"], isaac.targets, models, num_splits = 3, processes = 1),
+                lambda : 3 * len(models)),
+               ("parse pages", lambda : [WebScrape.Parse_Course_Page(html, term, subject) for term, subject, html in pages],
+                lambda : len(pages))]
+
+    results = []
+    stdout = sys.stdout
+    sys.stdout = codecs.open(os.devnull, "w", "utf-8")
+    try:
+        for name, stage, items in stages:
+            peak, start = instrument.peak_resident_bytes(), time.time()
+            stage()
+            results.append((name, time.time() - start, instrument.growth(peak, instrument.peak_resident_bytes()), items()))
+    finally:
+        sys.stdout = stdout
+    queue.put(results)
+
+
+def git_version():
+    import subprocess
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr = open(os.devnull, "w")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# Times every stage over synthetic data at each scale (generated under data_dir on first
+# use, with caches cleared before each run) and appends the results to results_path
+def bench_suite(scales = SUITE_SCALES, data_dir = ".bench_data", results_path = "bench_results.json"):
+    from multiprocessing import Process, Queue
+    import json
+    import synthetic
+    history = json.load(open(results_path)) if os.path.exists(results_path) else []
+    for scale in scales:
+        directory = os.path.join(data_dir, "x%g" % scale)
+        if not os.path.isdir(directory):
+            num_terms = synthetic.generate(scale, directory)
+            term_dir = os.path.join(directory, synthetic.PAST_TERMS)
+            synthetic.write_pages([os.path.join(term_dir, "course_data_S%d.json" % i) for i in range(min(2, num_terms))],
+                                  os.path.join(directory, "pages"))
+        queue = Queue()
+        child = Process(target = _run_stages, args = (os.path.abspath(directory), queue))
+        child.start()
+        stages = queue.get()
+        child.join()
+
+        print "===== Benchmark Suite at %gx (stage : ms : peak MB added : items) =====\n" % scale
+        for name, seconds, peak, items in stages:
+            print "%-22s %10.1f %8s %10d" % (name, seconds * 1000, instrument.megabytes(peak), items)
+        print
+        history.append({"version": git_version(), "time": time.time(), "scale": scale,
+                        "stages": {name : {"seconds": seconds, "peak_bytes": peak, "items": items}
+                                   for name, seconds, peak, items in stages}})
+        with open(results_path, "w") as f:
+            json.dump(history, f, indent = 1)
+
+
+# Compares the latest suite run at each scale with the latest earlier run of another
+# version and flags stages that got slower by more than threshold (a ratio) and by at
+# least min_ms, so millisecond-scale noise isn't flagged
+def bench_compare(results_path = "bench_results.json", threshold = 1.2, min_ms = 10):
+    import json
+    history = json.load(open(results_path))
+    for scale in sorted({run["scale"] for run in history}):
+        runs = [run for run in history if run["scale"] == scale]
+        latest = runs[-1]
+        earlier = [run for run in runs[:-1] if run["version"] != latest["version"]] or runs[:-1]
+        if not earlier:
+            print "Only one run at %gx" % scale
+            continue
+        baseline = earlier[-1]
+        print "===== %gx: %s against %s (stage : ms before : ms now : ratio) =====\n" % (scale, latest["version"], baseline["version"])
+        for name, stage in sorted(latest["stages"].items()):
+            if name in baseline["stages"]:
+                before, now = baseline["stages"][name]["seconds"], stage["seconds"]
+                ratio = now / before if before else float("inf")
+                print "%-22s %10.1f %10.1f %6.2f%s" % (name, before * 1000, now * 1000, ratio, "  REGRESSION" if ratio > threshold and (now - before) * 1000 >= min_ms else "")
+        print
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmarks for the Enroll scraper and analysis pipeline")
+    commands = parser.add_subparsers(dest = "command")
+
+    save = commands.add_parser("save", help = "download Enroll pages for offline benchmarks")
+    save.add_argument("directory")
+    save.add_argument("terms", nargs = "+")
+
+    scrape = commands.add_parser("scrape", help = "scraper pages/sec against a stub server")
+    scrape.add_argument("directory")
+    scrape.add_argument("--workers", type = int, default = WebScrape.MAX_WORKERS)
+    scrape.add_argument("--latency", type = float, default = .05, help = "seconds added to each response")
+    scrape.add_argument("--rate", type = float, default = 0, help = "requests/sec limit, 0 for none")
+
+    parse = commands.add_parser("parse", help = "parser backends over saved pages")
+    parse.add_argument("directory")
+
+    memory = commands.add_parser("memory", help = "resident memory of the loaded courses")
+    memory.add_argument("directory", nargs = "?", default = "Carleton Data - Past Terms")
+
+    commands.add_parser("schedule", help = "check and time the schedule module's time parsing")
+
+    suite = commands.add_parser("suite", help = "time every pipeline stage over synthetic data")
+    suite.add_argument("scales", nargs = "*", type = float, default = SUITE_SCALES)
+    suite.add_argument("--results", default = "bench_results.json")
+
+    compare = commands.add_parser("compare", help = "flag stages that got slower since the last version")
+    compare.add_argument("--results", default = "bench_results.json")
+    compare.add_argument("--threshold", type = float, default = 1.2)
+
+    args = parser.parse_args()
+    if args.command == "save":
+        save_pages(args.terms, args.directory)
+    elif args.command == "scrape":
+        bench_scrape(args.directory, args.workers, args.latency, args.rate)
+    elif args.command == "parse":
+        # Exit non-zero when the backends disagree, so the parity check can gate a change
+        if bench_parse(args.directory):
+            sys.exit(1)
+    elif args.command == "memory":
+        bench_memory(args.directory)
+    elif args.command == "schedule":
+        # Exit non-zero on any mismatch, so the check can gate a change
+        if not bench_schedule():
+            sys.exit(1)
+    elif args.command == "suite":
+        bench_suite(args.scales, results_path = args.results)
+    elif args.command == "compare":
+        bench_compare(args.results, args.threshold)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+from __future__ import division
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Columnar, memory-mapped copy of the Enroll term files, one partition per term file.
+#
+# Every string field is dictionary-encoded: an int32 code per course plus the term's
+# vocabulary (-1 when the course has no such field). Distros are stored as a flattened
+# list of codes with per-course offsets. registered/size are also kept as float columns
+# (nan when missing) so analysis can use them directly. Summaries are deduplicated into
+# one utf-8 blob with offsets. Everything loads with np.load(mmap_mode = "r"), and each
+# partition is rebuilt on its own when its term file changes.
+
+STORE_VERSION = 3
+STORE_DIR = ".course_store"
+STRING_FIELDS = ["term", "department", "course_num", "title", "faculty", "requirements_met",
+                 "credits", "registered", "size", "start_time", "end_time"]
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return np.nan
+
+
+def file_sha1(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+# Term files in source_dir, in the order initialize_data has always read them
+def source_files(source_dir):
+    return [os.path.join(source_dir, name) for name in os.listdir(source_dir) if name.endswith(".json")]
+
+
+# Where the partition for a term file lives
+def partition_dir(source_path, store_dir = STORE_DIR):
+    source_dir, name = os.path.split(os.path.abspath(source_path))
+    return os.path.join(store_dir, hashlib.sha1(source_dir.encode("utf-8")).hexdigest()[:8] + "_" + name[:-len(".json")])
+
+
+class CourseStore(object):
+
+    def __init__(self, partition):
+        self.partition = partition
+        with open(os.path.join(partition, "vocab.json")) as f:
+            self.vocab = json.load(f)
+        load = lambda name : np.load(os.path.join(partition, name + ".npy"), mmap_mode = "r")
+        self.codes = {field : load(field) for field in STRING_FIELDS}
+        self.registered, self.size = load("registered_num"), load("size_num")
+        self.distro_offsets, self.distro_codes = load("distro_offsets"), load("distro_codes")
+        self.summary_codes = load("summary_codes")
+        self.summary_offsets = load("summary_offsets")
+        self.summary_blob = load("summary_blob")
+
+    def __len__(self):
+        return len(self.codes["term"])
+
+    # Applies a predicate to each distinct value of field and returns the result for every
+    # course as a boolean array; courses without the field get missing
+    def vocab_mask(self, field, predicate, missing = False):
+        per_value = np.array([bool(predicate(value)) for value in self.vocab[field]] + [missing], dtype = bool)
+        return per_value[self.codes[field]]
+
+
+# Converts one term file into a partition of the store
+def build(source_path, store_dir = STORE_DIR):
+    partition = partition_dir(source_path, store_dir)
+    if not os.path.isdir(partition):
+        os.makedirs(partition)
+    manifest_path = os.path.join(partition, "manifest.json")
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    # Clear the rest, so columns an older STORE_VERSION wrote don't linger
+    for name in os.listdir(partition):
+        os.remove(os.path.join(partition, name))
+
+    vocab = {field : [] for field in STRING_FIELDS + ["distro"]}
+    lookup = {field : {} for field in vocab}
+    def encode(field, value):
+        if value is None:
+            return -1
+        codes = lookup[field]
+        if value not in codes:
+            codes[value] = len(vocab[field])
+            vocab[field].append(value)
+        return codes[value]
+
+    codes = {field : [] for field in STRING_FIELDS}
+    registered, size = [], []
+    distro_offsets, distro_codes = [0], []
+    summary_codes, summaries, summary_lookup = [], [], {}
+    with open(source_path) as f:
+        term_courses = json.load(f)["course_info"]
+    for course in term_courses:
+        for field in STRING_FIELDS:
+            codes[field].append(encode(field, course.get(field)))
+        registered.append(to_float(course.get("registered")))
+        size.append(to_float(course.get("size")))
+        for distro in course.get("requirements_met", "").split("\n"):
+            if distro:
+                distro_codes.append(encode("distro", distro))
+        distro_offsets.append(len(distro_codes))
+        summary = course.get("summary")
+        if summary is None:
+            summary_codes.append(-1)
+        else:
+            if summary not in summary_lookup:
+                summary_lookup[summary] = len(summaries)
+                summaries.append(summary.encode("utf-8"))
+            summary_codes.append(summary_lookup[summary])
+
+    save = lambda name, values, dtype : np.save(os.path.join(partition, name + ".npy"), np.asarray(values, dtype = dtype))
+    for field in STRING_FIELDS:
+        save(field, codes[field], np.int32)
+    save("registered_num", registered, np.float64)
+    save("size_num", size, np.float64)
+    save("distro_offsets", distro_offsets, np.int64)
+    save("distro_codes", distro_codes, np.int32)
+    save("summary_codes", summary_codes, np.int32)
+    save("summary_offsets", np.cumsum([0] + [len(s) for s in summaries]), np.int64)
+    save("summary_blob", np.frombuffer(b"".join(summaries), dtype = np.uint8), np.uint8)
+    with open(os.path.join(partition, "vocab.json"), "w") as f:
+        json.dump(vocab, f)
+    # Written last: a partition without a manifest is never considered up to date
+    with open(manifest_path, "w") as f:
+        json.dump({"version": STORE_VERSION, "source": os.path.abspath(source_path),
+                   "mtime": os.path.getmtime(source_path), "sha1": file_sha1(source_path)}, f)
+
+
+# True if the partition for source_path was built from the file's current contents.
+# If only the mtime changed (same hash), the recorded mtime is refreshed instead.
+def is_current(source_path, store_dir = STORE_DIR):
+    manifest_path = os.path.join(partition_dir(source_path, store_dir), "manifest.json")
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest["version"] != STORE_VERSION:
+        return False
+    mtime = os.path.getmtime(source_path)
+    if mtime != manifest["mtime"]:
+        if file_sha1(source_path) != manifest["sha1"]:
+            return False
+        manifest["mtime"] = mtime
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+    return True
+
+
+# Opens the partition for one term file, rebuilding it first if the file changed
+def load_term(source_path, store_dir = STORE_DIR):
+    if not is_current(source_path, store_dir):
+        build(source_path, store_dir)
+    return CourseStore(partition_dir(source_path, store_dir))
+
+
+# Opens the partitions for every term file in source_dir
+def load(source_dir, store_dir = STORE_DIR):
+    return [load_term(path, store_dir) for path in source_files(source_dir)]
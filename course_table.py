@@ -0,0 +1,99 @@
+from array import array
+
+import numpy as np
+from course_store import STRING_FIELDS
+
+# Compact in-memory table of courses: one column per field instead of one dict per course.
+#
+# Every string field (and the summary) is dictionary-coded: an array("i") of codes into a
+# per-field vocabulary, with -1 for courses missing the field. A department, faculty
+# string or summary is therefore held once however many sections share it, and a course
+# costs 4 bytes per field. Analysis reads whole columns; row(i) rebuilds the dict found
+# in the term files when one course is needed.
+
+FIELDS = STRING_FIELDS + ["summary"]
+
+
+class CourseTable(object):
+
+    def __init__(self):
+        self.vocab = {field : [] for field in FIELDS}
+        self.lookup = {field : {} for field in FIELDS}
+        self.codes = {field : array("i") for field in FIELDS}
+
+    # Table of the courses at indices (all by default) of a course_store.CourseStore
+    @classmethod
+    def from_store(cls, store, indices = None):
+        table = cls()
+        indices = np.arange(len(store)) if indices is None else np.asarray(indices, dtype = np.intp)
+        for field in STRING_FIELDS:
+            table._extend_field(field, store.vocab[field], np.asarray(store.codes[field])[indices])
+        # Only the summaries these courses use are decoded
+        summary_codes = np.asarray(store.summary_codes)[indices]
+        used = np.unique(summary_codes[summary_codes >= 0])
+        offsets, blob = store.summary_offsets, store.summary_blob
+        summaries = [None] * (int(used[-1]) + 1 if len(used) else 0)
+        for code in used.tolist():
+            summaries[code] = blob[offsets[code]:offsets[code + 1]].tostring().decode("utf-8")
+        table._extend_field("summary", summaries, summary_codes)
+        return table
+
+    def __len__(self):
+        return len(self.codes["term"])
+
+    def _code(self, field, value):
+        lookup = self.lookup[field]
+        if value not in lookup:
+            lookup[value] = len(self.vocab[field])
+            self.vocab[field].append(value)
+        return lookup[value]
+
+    # Appends codes given against another vocabulary, re-coding them into this table's.
+    # Only vocabulary entries the codes actually use are looked up.
+    def _extend_field(self, field, vocab, codes):
+        codes = np.asarray(codes, dtype = np.intp)
+        used = np.unique(codes)
+        used = used[used >= 0]
+        recode = np.full(len(vocab) + 1, -1, dtype = np.int32)
+        recode[used] = [self._code(field, vocab[code]) for code in used.tolist()]
+        self.codes[field].fromstring(recode[codes].tostring())
+
+    # Appends every course of another table
+    def extend(self, other):
+        for field in FIELDS:
+            self._extend_field(field, other.vocab[field], other.codes[field])
+
+    # Codes of a field as a numpy array (shares the table's memory) and the vocabulary
+    def encoded(self, field):
+        return np.frombuffer(self.codes[field], dtype = np.int32), self.vocab[field]
+
+    # Every course's value of a field, None where missing
+    def column(self, field):
+        vocab = self.vocab[field] + [None]
+        return [vocab[code] for code in self.codes[field]]
+
+    # Each course's distros, in listed order
+    def distros(self):
+        vocab = [filter(None, distros.split("\n")) for distros in self.vocab["requirements_met"]] + [[]]
+        return [vocab[code] for code in self.codes["requirements_met"]]
+
+    # One course as the dict found in the term file
+    def row(self, i):
+        course = {}
+        for field in FIELDS:
+            code = self.codes[field][i]
+            if code >= 0:
+                course[field] = self.vocab[field][code]
+        return course
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self.row(i)
+
+    # Pickles as codes and vocabularies; the lookups are rebuilt on load
+    def __getstate__(self):
+        return {"vocab": self.vocab, "codes": self.codes}
+
+    def __setstate__(self, state):
+        self.vocab, self.codes = state["vocab"], state["codes"]
+        self.lookup = {field : {value : i for i, value in enumerate(vocab)} for field, vocab in self.vocab.items()}
@@ -0,0 +1,191 @@
+from __future__ import division
+from collections import OrderedDict
+from itertools import combinations
+import json
+import threading
+import urlparse
+
+import numpy as np
+import groupby
+import local_http
+
+# Materialised enrollment cube over department x distro x start x duration x term.
+#
+# Every combination of dimensions (all 32 cuboids of the lattice) is precomputed as cells
+# of [sum of targets, number of courses], so a roll-up or drill-down query reads one
+# cuboid instead of the courses. Distro is multi-valued: cuboids over distro count a
+# course once per distro it meets, and the others count it once. So there are two base
+# cuboids built from the courses, and every other cuboid is rolled up from the base that
+# counts courses the same way. Courses meeting no distro are kept under the empty distro.
+#
+# make_server() answers queries over HTTP from a cube held in memory:
+#
+#     /dimensions                                     every dimension's members
+#     /query?department=HIST&distro=...&by=term       mean and count per cell
+#
+# Query parameters fix dimensions to a member and by= lists the dimensions to break the
+# answer down by. JSON responses are kept in an LRU cache keyed by the query. The server
+# is a local_http one, with a thread per connection.
+
+DIMENSIONS = ["department", "distro", "start", "duration", "term"]
+
+# Dimension -> its course_columns key
+COLUMNS = {"department": "department", "distro": "distros", "start": "start", "duration": "duration", "term": "term"}
+
+
+# A member as it appears in a query string
+def _text(member):
+    if member is None:
+        return u""
+    return member if isinstance(member, unicode) else unicode(member)
+
+
+class Cuboid(object):
+
+    # coords: one row of member codes per cell, one column per dimension in dims
+    def __init__(self, dims, coords, sums, counts):
+        self.dims = dims
+        self.coords = coords
+        self.sums = sums
+        self.counts = counts
+
+    # The cuboid over a subset of this one's dimensions, summing the cells that merge.
+    # shape gives each of this cuboid's dimensions' number of members.
+    def roll_up(self, dims, shape):
+        columns = [self.dims.index(dim) for dim in dims]
+        if columns:
+            keys = np.ravel_multi_index(self.coords[:, columns].T, [shape[i] for i in columns])
+        else:
+            keys = np.zeros(len(self.sums), dtype = np.intp)
+        cells, inverse = np.unique(keys, return_inverse = True)
+        sums = np.bincount(inverse, weights = self.sums, minlength = len(cells))
+        counts = np.bincount(inverse, weights = self.counts, minlength = len(cells)).astype(np.int64)
+        if columns:
+            coords = np.column_stack(np.unravel_index(cells, [shape[i] for i in columns]))
+        else:
+            coords = np.zeros((len(cells), 0), dtype = np.intp)
+        return Cuboid(tuple(dims), coords, sums, counts)
+
+
+class Cube(object):
+
+    # columns: course_columns output plus a "term" column; targets: each course's fill rate
+    def __init__(self, columns, targets):
+        targets = np.asarray(targets, dtype = np.float64)
+        codes, self.members = {}, {}
+        for dim in DIMENSIONS:
+            if dim != "distro":
+                codes[dim], self.members[dim] = groupby.encode(columns[COLUMNS[dim]])
+        rows, codes["distro"], self.members["distro"] = groupby.encode_multi(
+            [distros or [None] for distros in columns[COLUMNS["distro"]]])
+        self.lookup = {dim : {_text(member) : i for i, member in enumerate(members)} for dim, members in self.members.items()}
+
+        single = tuple(dim for dim in DIMENSIONS if dim != "distro")
+        course_base = self._base(single, [codes[dim] for dim in single], targets)
+        distro_base = self._base(tuple(DIMENSIONS), [codes[dim] if dim == "distro" else codes[dim][rows] for dim in DIMENSIONS],
+                                 targets[rows])
+        self.cuboids = {}
+        for size in range(len(DIMENSIONS) + 1):
+            for dims in combinations(DIMENSIONS, size):
+                base = distro_base if "distro" in dims else course_base
+                self.cuboids[dims] = base.roll_up(dims, self._shape(base.dims))
+
+    def _shape(self, dims):
+        return [len(self.members[dim]) for dim in dims]
+
+    # The cuboid over dims with one cell per distinct combination of codes
+    def _base(self, dims, codes, targets):
+        coords = np.column_stack(codes) if len(targets) else np.zeros((0, len(dims)), dtype = np.intp)
+        rows = Cuboid(dims, coords, targets, np.ones(len(targets)))
+        return rows.roll_up(dims, self._shape(dims))
+
+    def __len__(self):
+        return sum(len(cuboid.sums) for cuboid in self.cuboids.values())
+
+    # Mean target and course count of each cell matching where ({dimension: member}),
+    # broken down by the dimensions in by and sorted by them. Members may be given as
+    # their query-string text. Raises ValueError for an unknown dimension.
+    def query(self, where = None, by = ()):
+        where = where or {}
+        unknown = [dim for dim in list(where) + list(by) if dim not in self.members]
+        if unknown:
+            raise ValueError("unknown dimension %s (dimensions are %s)" % (unknown[0], ", ".join(DIMENSIONS)))
+        cuboid = self.cuboids[tuple(dim for dim in DIMENSIONS if dim in where or dim in by)]
+        mask = np.ones(len(cuboid.sums), dtype = bool)
+        for dim, member in where.items():
+            code = self.lookup[dim].get(_text(member))
+            if code is None:
+                return []
+            mask &= cuboid.coords[:, cuboid.dims.index(dim)] == code
+        columns = [cuboid.dims.index(dim) for dim in by]
+        cells = []
+        for coords, total, count in zip(cuboid.coords[mask].tolist(), cuboid.sums[mask].tolist(), cuboid.counts[mask].tolist()):
+            cell = OrderedDict((dim, self.members[dim][coords[i]]) for dim, i in zip(by, columns))
+            cell["mean"], cell["count"] = total / count, count
+            cells.append(cell)
+        cells.sort(key = lambda cell : [cell[dim] for dim in by])
+        return cells
+
+
+# Least-recently-used cache of query results, safe to share between threads
+class QueryCache(object):
+
+    def __init__(self, size = 1024):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            value = self.entries.pop(key)
+            self.entries[key] = value
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            if len(self.entries) > self.size:
+                self.entries.popitem(last = False)
+
+
+# An HTTP server answering /dimensions and /query from cube. Call serve_forever() on it.
+def make_server(cube, host = "127.0.0.1", port = 8000, cache_size = 1024):
+    cache = QueryCache(cache_size)
+    dimensions = json.dumps(OrderedDict((dim, cube.members[dim]) for dim in DIMENSIONS))
+
+    class Handler(local_http.Handler):
+
+        def do_GET(self):
+            url = urlparse.urlparse(self.path)
+            if url.path == "/dimensions":
+                self.send(200, dimensions, "application/json")
+            elif url.path == "/query":
+                params = urlparse.parse_qs(url.query, keep_blank_values = True)
+                by = tuple(dim for value in params.pop("by", []) for dim in value.split(",") if dim)
+                try:
+                    where = tuple(sorted((dim, values[-1].decode("utf-8")) for dim, values in params.items()))
+                except UnicodeDecodeError:
+                    self.send(400, json.dumps({"error": "query is not valid UTF-8"}), "application/json")
+                    return
+                key = (where, by)
+                body = cache.get(key)
+                if body is None:
+                    try:
+                        body = json.dumps({"cells": cube.query(dict(where), by)})
+                    except ValueError as e:
+                        self.send(400, json.dumps({"error": str(e)}), "application/json")
+                        return
+                    cache.put(key, body)
+                self.send(200, body, "application/json")
+            else:
+                self.send(404, json.dumps({"error": "no such endpoint " + url.path}), "application/json")
+
+    server = local_http.make_server(Handler, host, port)
+    server.cache = cache
+    return server
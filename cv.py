@@ -0,0 +1,94 @@
+from __future__ import division
+from collections import OrderedDict
+from multiprocessing import Pool, cpu_count
+import time
+
+import numpy as np
+
+# Repeated 80/20 cross-validation over a process pool.
+#
+# Each split is a pair of index arrays drawn from a fixed seed, so the same splits (and
+# the same model seeds) come back on every run and no rows are copied until a fold is
+# fitted. Every (model, split) pair is an independent task. The matrix, targets, splits
+# and models reach each worker once, through the pool's initializer, instead of being
+# pickled per task; that works whether workers are forked or spawned (as on Windows).
+
+_matrix = None
+_targets = None
+_splits = None
+_models = None
+
+
+# Sets the data _run reads, in this process or a pool worker
+def _init(matrix, targets, splits, models):
+    global _matrix, _targets, _splits, _models
+    _matrix, _targets, _splits, _models = matrix, targets, splits, models
+
+
+# Index arrays for repeated random train/test partitions: about train_fraction of the
+# rows go to training in each split, like the old random.random() < .8 loop
+def splits(n, num_splits = 10, train_fraction = .8, seed = 0):
+    result = []
+    for k in range(num_splits):
+        train = np.random.RandomState(seed + k).random_sample(n) < train_fraction
+        result.append((np.flatnonzero(train), np.flatnonzero(~train)))
+    return result
+
+
+# Fits one model on one split; returns (name, split, absolute error, fit seconds, predict seconds)
+def _run(task):
+    from sklearn.base import clone
+    from sklearn import metrics
+    name, k = task
+    model = clone(_models[name])
+    if "random_state" in model.get_params():
+        model.set_params(random_state = k)
+    train, test = _splits[k]
+    start = time.time()
+    model.fit(_matrix[train], _targets[train])
+    fitted = time.time()
+    predictions = model.predict(_matrix[test])
+    predicted = time.time()
+    error = metrics.mean_absolute_error(_targets[test], predictions)
+    return name, k, error, fitted - start, predicted - fitted
+
+
+# Cross-validates every model in models (name -> unfitted estimator) on the same splits,
+# spreading all (model, split) fits across processes. Returns name -> dict of the number
+# of splits, error mean, std and min, and total fit and predict seconds.
+def cross_validate(matrix, targets, models, num_splits = 10, seed = 0, processes = None):
+    targets = np.asarray(targets, dtype = np.float64)
+    data = (matrix, targets, splits(len(targets), num_splits, seed = seed), OrderedDict(models))
+    _init(*data)
+
+    # Tasks are handed out in model order, so listing the slowest models first keeps a long
+    # forest fit from starting last and holding up the pool
+    tasks = [(name, k) for name in _models for k in range(num_splits)]
+    processes = min(processes or cpu_count(), len(tasks))
+    if processes > 1:
+        pool = Pool(processes, initializer = _init, initargs = data)
+        try:
+            runs = pool.map(_run, tasks, chunksize = 1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        runs = map(_run, tasks)
+
+    results = OrderedDict()
+    for name in _models:
+        errors = np.array([run[2] for run in runs if run[0] == name])
+        results[name] = {
+            "splits": num_splits, "mean": errors.mean(), "std": errors.std(), "min": errors.min(),
+            "fit": sum(run[3] for run in runs if run[0] == name),
+            "predict": sum(run[4] for run in runs if run[0] == name),
+        }
+    return results
+
+
+def report(results):
+    for name, result in results.items():
+        print "=====", name, "Results =====\n"
+        print "Mean absolute error over %d splits: %.4f (std %.4f, min %.4f)" % (
+            result["splits"], result["mean"], result["std"], result["min"])
+        print "Fit time: %.2fs, predict time: %.2fs\n\n" % (result["fit"], result["predict"])
@@ -0,0 +1,177 @@
+from __future__ import division
+import hashlib
+import json
+import os
+
+import numpy as np
+import groupby
+
+# Feature matrix for the enrollment models, built a column at a time.
+#
+# Input is a dict of per-course columns (see isaac.course_columns): department, distros
+# (list per course), start and duration (hours), title and faculty, plus the
+# RateMyProfessors ratings keyed by faculty. Categorical columns are integer-coded with
+# encoders learned by fit(), so future terms reuse the same codes; values never seen in
+# training get code -1 (or an all-zero one-hot row).
+#
+# Dense layout (the original 11 columns, label-coded then standardised):
+#   0      department            single-var random tree absolute error: .190
+#   1 - 4  distros, in order     .217
+#   5      start time            .214
+#   6, 7   prof rating, number of ratings   linreg .224, .232
+#   8      course title          .183
+#   9      duration in hours     linreg .231
+#   10     professor             .184
+# With one_hot, department, distros, title and professor become sparse indicator columns
+# and start, ratings and duration stay numeric (standardised).
+
+MAX_DISTROS = 4
+CACHE_DIR = ".feature_cache"
+# Part of every feature cache key: bump it whenever FeaturePipeline's output changes, so
+# matrices cached by older code are rebuilt
+FEATURES_VERSION = 1
+
+
+class FeaturePipeline(object):
+
+    def __init__(self, one_hot = False):
+        self.one_hot = one_hot
+        self.categories = {}
+        self.mean = self.std = None
+
+    # Learns category codes and scaling statistics from training columns
+    def fit(self, columns, ratings):
+        self.categories = {
+            "department": sorted(set(columns["department"])),
+            "distro": sorted({distro for distros in columns["distros"] for distro in distros}),
+            "start": sorted(set(columns["start"])),
+            "title": sorted(set(columns["title"])),
+            "faculty": sorted(set(columns["faculty"])),
+        }
+        numeric = self._numeric(columns, ratings)
+        self.mean = numeric.mean(axis = 0)
+        self.std = numeric.std(axis = 0)
+        # A constant column carries no information; leave it centred at 0 instead of nan
+        self.std[self.std == 0] = 1
+        return self
+
+    def _codes(self, name, values):
+        index = {value : i for i, value in enumerate(self.categories[name])}
+        return np.array([index.get(value, -1) for value in values], dtype = np.intp)
+
+    # Distro codes as an (n, MAX_DISTROS) array in listed order, 0 past the last distro
+    def _distro_slots(self, distro_lists):
+        rows, _, _ = groupby.encode_multi(distro_lists)
+        slots = np.zeros((len(distro_lists), MAX_DISTROS))
+        if len(rows):
+            flat_codes = self._codes("distro", [distro for distros in distro_lists for distro in _unique(distros)])
+            # Position of each distro within its course's list
+            position = np.arange(len(rows)) - np.searchsorted(rows, rows)
+            keep = position < MAX_DISTROS
+            slots[rows[keep], position[keep]] = flat_codes[keep]
+        return slots
+
+    def _ratings(self, faculty, ratings):
+        rated = [ratings.get(name, (0, 0)) for name in faculty]
+        return np.array([prof[0] for prof in rated], dtype = np.float64), np.array([prof[1] for prof in rated], dtype = np.float64)
+
+    # Unscaled columns that get standardised
+    def _numeric(self, columns, ratings):
+        rating, num_ratings = self._ratings(columns["faculty"], ratings)
+        duration = np.asarray(columns["duration"], dtype = np.float64)
+        if self.one_hot:
+            start = np.asarray(columns["start"], dtype = np.float64)
+            return np.column_stack([start, rating, num_ratings, duration])
+        return np.column_stack([
+            self._codes("department", columns["department"]),
+            self._distro_slots(columns["distros"]),
+            self._codes("start", columns["start"]),
+            rating, num_ratings,
+            self._codes("title", columns["title"]),
+            duration,
+            self._codes("faculty", columns["faculty"]),
+        ]).astype(np.float64)
+
+    def _indicators(self, name, codes, rows = None):
+        from scipy import sparse
+        n = len(codes) if rows is None else rows[1]
+        row_index = np.arange(n) if rows is None else rows[0]
+        known = codes >= 0
+        return sparse.csr_matrix((np.ones(known.sum()), (row_index[known], codes[known])),
+                                 shape = (n, len(self.categories[name])))
+
+    def transform(self, columns, ratings):
+        scaled = (self._numeric(columns, ratings) - self.mean) / self.std
+        if not self.one_hot:
+            return scaled
+        from scipy import sparse
+        rows, _, _ = groupby.encode_multi(columns["distros"])
+        flat = [distro for distros in columns["distros"] for distro in _unique(distros)]
+        blocks = [sparse.csr_matrix(scaled),
+                  self._indicators("department", self._codes("department", columns["department"])),
+                  self._indicators("distro", self._codes("distro", flat), (rows, len(scaled))),
+                  self._indicators("title", self._codes("title", columns["title"])),
+                  self._indicators("faculty", self._codes("faculty", columns["faculty"]))]
+        return sparse.hstack(blocks, format = "csr")
+
+    def fit_transform(self, columns, ratings):
+        return self.fit(columns, ratings).transform(columns, ratings)
+
+    def to_dict(self):
+        return {"one_hot": self.one_hot, "categories": self.categories,
+                "mean": self.mean.tolist(), "std": self.std.tolist()}
+
+    @classmethod
+    def from_dict(cls, state):
+        pipeline = cls(state["one_hot"])
+        pipeline.categories = state["categories"]
+        pipeline.mean, pipeline.std = np.array(state["mean"]), np.array(state["std"])
+        return pipeline
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def _unique(values):
+    seen = set()
+    return [value for value in values if not (value in seen or seen.add(value))]
+
+
+# Hash of everything the matrix depends on: the pipeline version and options, the columns
+# and the ratings
+def input_hash(columns, ratings, one_hot):
+    digest = hashlib.sha1(json.dumps({"version": FEATURES_VERSION, "one_hot": one_hot, "columns": columns}, sort_keys = True))
+    used = sorted((name, list(ratings[name][:2])) for name in set(columns["faculty"]) if name in ratings)
+    digest.update(json.dumps(used))
+    return digest.hexdigest()
+
+
+# Fits a pipeline and builds the matrix, or loads both from the feature cache when the
+# same columns and ratings were seen before. Returns (pipeline, matrix).
+def cached_fit_transform(columns, ratings, one_hot = False, cache_dir = CACHE_DIR):
+    key = os.path.join(cache_dir, input_hash(columns, ratings, one_hot))
+    if os.path.exists(key + ".json"):
+        pipeline = FeaturePipeline.load(key + ".json")
+        if one_hot:
+            from scipy import sparse
+            return pipeline, sparse.load_npz(key + ".npz")
+        return pipeline, np.load(key + ".npy")
+
+    pipeline = FeaturePipeline(one_hot)
+    matrix = pipeline.fit_transform(columns, ratings)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    if one_hot:
+        from scipy import sparse
+        sparse.save_npz(key + ".npz", matrix)
+    else:
+        np.save(key + ".npy", matrix)
+    # Written last, so a cache entry is only used once its matrix is complete
+    pipeline.save(key + ".json")
+    return pipeline, matrix
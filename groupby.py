@@ -0,0 +1,68 @@
+from __future__ import division
+from collections import namedtuple
+import numpy as np
+
+# Group-by/aggregate over integer-coded columns.
+#
+# Keys are encoded once into integer codes, then every statistic comes out of a single
+# vectorized pass: np.bincount for counts and sums, np.maximum.at for maxima. Sums are
+# accumulated in row order, so means match sum(list) / len(list) exactly.
+
+# keys: distinct keys in group order; count, mean, max: numpy arrays aligned with keys
+Groups = namedtuple("Groups", ["keys", "count", "mean", "max"])
+
+
+# Integer codes for a list of hashable keys. Groups follow order if given (every key must
+# appear in it), otherwise the order keys are first seen in.
+def encode(keys, order = None):
+    if order is None:
+        order = []
+        seen = set()
+        for key in keys:
+            if key not in seen:
+                seen.add(key)
+                order.append(key)
+    index = {key : i for i, key in enumerate(order)}
+    return np.array([index[key] for key in keys], dtype = np.intp), list(order)
+
+
+# Integer codes for multi-valued keys, e.g. each course's list of distros. Returns the row
+# each code came from, the codes and the distinct keys. A key listed twice for the same
+# row only counts once.
+def encode_multi(key_lists, order = None):
+    rows, flat = [], []
+    for row, keys in enumerate(key_lists):
+        seen = set()
+        for key in keys:
+            if key not in seen:
+                seen.add(key)
+                rows.append(row)
+                flat.append(key)
+    codes, order = encode(flat, order)
+    return np.array(rows, dtype = np.intp), codes, order
+
+
+# Count, mean and max of values per group, from codes (and rows, for multi-valued keys)
+def aggregate(codes, values, num_groups, rows = None):
+    values = np.asarray(values, dtype = np.float64)
+    if rows is not None:
+        values = values[rows]
+    count = np.bincount(codes, minlength = num_groups)
+    total = np.bincount(codes, weights = values, minlength = num_groups)
+    maximum = np.full(num_groups, -np.inf)
+    np.maximum.at(maximum, codes, values)
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        mean = total / count
+    return count, mean, maximum
+
+
+# Groups values by keys (one key per row, or a list of keys per row if multi) and
+# returns a Groups of per-key count, mean and max
+def group_by(keys, values, order = None, multi = False):
+    if multi:
+        rows, codes, order = encode_multi(keys, order)
+    else:
+        rows = None
+        codes, order = encode(keys, order)
+    count, mean, maximum = aggregate(codes, values, len(order), rows)
+    return Groups(order, count, mean, maximum)
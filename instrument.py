@@ -0,0 +1,197 @@
+from __future__ import division
+from collections import OrderedDict
+import json
+import os
+import sys
+import threading
+import time
+
+# Named spans around pipeline stages: wall time, CPU time, memory and item counts.
+#
+#     with instrument.span("analyze.profs") as s:
+#         ...
+#         s.items = len(courses)
+#
+# Spans nest per thread. Each finished span records its wall and CPU seconds, how much
+# the peak memory grew while it ran (tracemalloc's traced peak when tracemalloc is
+# tracing, otherwise the process's peak resident size) and an optional item count.
+# Recording is off until enable(); while off, span() hands back one shared no-op object,
+# so instrumented code pays a global lookup and a call per span. Reports export as JSON,
+# as Chrome trace events (chrome://tracing, speedscope, Perfetto) and as collapsed
+# stacks for flamegraph.pl.
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+_enabled = False
+_origin = time.time()
+_records = []
+_local = threading.local()
+
+
+# Peak resident size of this process so far in bytes, or None where there is no resource
+# module (Windows). ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+def peak_resident_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+# Growth between two peak measurements, or None if either is unknown
+def growth(before, after):
+    return None if before is None or after is None else after - before
+
+
+# Bytes as megabytes for the reports, "n/a" when unknown
+def megabytes(size):
+    return "n/a" if size is None else "%.1f" % (size / 2 ** 20)
+
+
+def _peak_memory():
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[1]
+    return peak_resident_bytes()
+
+
+def _cpu_time():
+    times = os.times()
+    return times[0] + times[1]
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span(object):
+
+    def __init__(self, name, items = None):
+        self.name = name
+        self.items = items
+
+    def __enter__(self):
+        stack = _stack()
+        self.path = stack[-1].path + (self.name,) if stack else (self.name,)
+        stack.append(self)
+        self.memory = _peak_memory()
+        self.cpu = _cpu_time()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.time()
+        cpu = _cpu_time()
+        memory = _peak_memory()
+        _stack().pop()
+        _records.append({
+            "name": self.name, "path": list(self.path), "thread": threading.current_thread().ident,
+            "start": self.start - _origin, "seconds": end - self.start, "cpu_seconds": cpu - self.cpu,
+            "peak_bytes": growth(self.memory, memory), "items": self.items,
+        })
+        return False
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+# A span to use as a context manager; a shared no-op while recording is off
+def span(name, items = None):
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, items)
+
+
+# Starts recording. With memory and tracemalloc available, memory is measured by tracing
+# allocations, which is slower but attributes memory to spans precisely.
+def enable(memory = False):
+    global _enabled
+    if memory and tracemalloc is not None and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    del _records[:]
+
+
+# Finished spans in the order they started
+def records():
+    return sorted(_records, key = lambda record : record["start"])
+
+
+# Per span name: calls, total wall and CPU seconds, largest peak growth and total items
+def summary():
+    totals = OrderedDict()
+    for record in records():
+        total = totals.setdefault(record["name"], {"calls": 0, "seconds": 0.0, "cpu_seconds": 0.0, "peak_bytes": None, "items": 0})
+        total["calls"] += 1
+        total["seconds"] += record["seconds"]
+        total["cpu_seconds"] += record["cpu_seconds"]
+        if record["peak_bytes"] is not None:
+            total["peak_bytes"] = max(total["peak_bytes"] or 0, record["peak_bytes"])
+        total["items"] += record["items"] or 0
+    return totals
+
+
+def report(out = None):
+    out = out or sys.stderr
+    print >> out, "===== Spans (span : calls : wall ms : CPU ms : peak MB added : items) =====\n"
+    for name, total in summary().items():
+        print >> out, "%-28s %6d %10.1f %10.1f %8s %10d" % (name, total["calls"], total["seconds"] * 1000,
+                total["cpu_seconds"] * 1000, megabytes(total["peak_bytes"]), total["items"])
+    print >> out
+
+
+def write_json(path):
+    with open(path, "w") as f:
+        json.dump({"spans": records(), "summary": summary()}, f, indent = 1)
+
+
+# Chrome trace event format: one complete ("X") event per span, timestamps in microseconds
+def write_chrome_trace(path):
+    pid = os.getpid()
+    events = [{"name": record["name"], "ph": "X", "pid": pid, "tid": record["thread"],
+               "ts": int(record["start"] * 1e6), "dur": int(record["seconds"] * 1e6),
+               "args": {"cpu_ms": record["cpu_seconds"] * 1000, "peak_bytes": record["peak_bytes"], "items": record["items"]}}
+              for record in records()]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+# Collapsed stacks ("load;load.terms 1234"), microseconds of self time per stack
+def write_collapsed(path):
+    self_time = OrderedDict()
+    for record in records():
+        key = ";".join(record["path"])
+        self_time[key] = self_time.get(key, 0) + record["seconds"]
+        if len(record["path"]) > 1:
+            parent = ";".join(record["path"][:-1])
+            self_time[parent] = self_time.get(parent, 0) - record["seconds"]
+    with open(path, "w") as f:
+        for key, seconds in self_time.items():
+            f.write("%s %d\n" % (key, max(0, int(seconds * 1e6))))
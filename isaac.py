@@ -1,36 +1,46 @@
 from __future__ import division
-from sklearn import linear_model, metrics
-from sklearn.naive_bayes import BernoulliNB, GaussianNB
-from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
-from sklearn.feature_selection import SelectFromModel
-from sklearn.neural_network import MLPRegressor
-from sklearn import linear_model
-from sklearn import svm
-from collections import defaultdict
-from afinn import Afinn
+import time
+STARTED = time.time()
+from collections import defaultdict, OrderedDict
+from array import array
+import argparse
+import codecs
+import subprocess
 import os
+import sys
 import json
-import numpy as np
-import math
-import random
-
-courses, targets, departments, distros, starts, profs, titles, durations = [], [], [], [], [], [], [], []
+import instrument
+import loader
+import course_store
+import aggregates
+import cube
+import groupby
+import schedule
+import features
+import cv
+import search as search_module
+import streaming
+import model_artifact
+from course_table import CourseTable
+from prof_index import ProfIndex
+from keyword_index import KeywordIndex
+from sentiment_cache import score_summaries
+
+# courses is a CourseTable (one column per field) and targets a parallel array of doubles
+courses, targets = CourseTable(), array("d")
+departments, distros, starts, profs, titles, durations = [], [], [], [], [], []
 dep_map, distro_map, start_map, prof_map, title_map, duration_map, dep_to_enroll, profs_to_ratings  = {}, {}, {}, {}, {}, {}, {}, {}
 
+# Number of courses dropped by each of loader.RULES
+excluded = OrderedDict()
 
-def prediction_variables_present(course):
-    for field in ["summary", "start_time", "end_time", "department", "requirements_met", 
-                  "registered", "size", "faculty", "title"]:
-        try:
-            if course[field] == "n/a":
-                return False
-        except:
-            return False
-    return float(course["size"]) > 0
+# Start and duration of every loaded course, parsed once at load time (see schedule.py)
+schedule_columns = {}
 
 
 # Input is a course's start time as a string
 # Returns number of hours past 8am in decimal format
+# (schedule.py derives the same from parsed minutes; schedule.verify checks it against this)
 def time_string_to_float(time):
     time_list = time.split(":")
     hour = int(time_list[0])
@@ -45,62 +55,71 @@ def time_string_to_float(time):
 
 def initialize_data():
     
-    # Read in data from Enroll
+    # Read in data from Enroll. Term files are loaded in parallel, and courses that aren't
+    # appropriate for analysis are dropped while loading (see loader.RULES)
     path = "Carleton Data - Past Terms"
-    for term in os.listdir(path):
-        markdown = open(path + "\\" + term).read()
-        for course in json.loads(markdown)["course_info"]:
-            
-            # Exclude courses that aren't appropriate for analysis
-            try:
-                # Since we're predicting on multiple variables in the same matrix,
-                # we'll want to make sure that all of our courses have all of said variables
-                has_components = prediction_variables_present(course)
-
-                is_ai = "Argument & Inquiry Seminar" in course["requirements_met"].split("\n")
-                is_pe = course["department"] == "PE"
-                
-                lab_in_title = "Lab" in course["title"]
-                is_music = course["department"] == "MUSC"
-                six_credits = course["credits"][0] == "6"
-                is_lab = lab_in_title and not is_music and not six_credits
-                
-                if has_components and not is_lab and not is_ai and not is_pe:
-                    courses.append(course)
-            except:
-                pass
-    targets.extend([float(course["registered"]) / float(course["size"]) for course in courses])
+    with instrument.span("load.terms") as span:
+        term_courses, term_targets, dropped = loader.load_terms(path)
+        courses.extend(term_courses)
+        targets.extend(term_targets.tolist())
+        excluded.update(dropped)
+        span.items = len(courses)
+    with instrument.span("load.schedule", len(courses)):
+        schedule_columns.update(schedule.columns(courses))
     
-    # Read in data from RateMyProfessors
-    markdown = open("RatingsData.json").read()
-    for prof in json.loads(markdown)["ratings"]:
-        first = prof["teacherfirstname_t"]
-        last = prof["teacherlastname_t"]
-        rating = prof["averageratingscore_rf"]
-        num_ratings = prof["total_number_of_ratings_i"]
-        profs.append((first, last, rating, num_ratings))
-    profs.sort(key = lambda prof : prof[3])
-    profs.sort(key = lambda prof : prof[2])
+    load_ratings()
+
+
+# Read in data from RateMyProfessors
+def load_ratings():
+    with instrument.span("load.ratings") as span:
+        markdown = open("RatingsData.json").read()
+        for prof in json.loads(markdown)["ratings"]:
+            first = prof["teacherfirstname_t"]
+            last = prof["teacherlastname_t"]
+            rating = prof["averageratingscore_rf"]
+            num_ratings = prof["total_number_of_ratings_i"]
+            profs.append((first, last, rating, num_ratings))
+        profs.sort(key = lambda prof : prof[3])
+        profs.sort(key = lambda prof : prof[2])
+        span.items = len(profs)
+
+
+# Fills profs_to_ratings with the RateMyProfessors entry of each faculty string that has one
+# Each distinct faculty string is matched once, filed under the department of its last course
+def match_profs():
+    prof_index = ProfIndex(profs)
+    faculty_to_dep = dict(zip(courses.column("faculty"), courses.column("department")))
+    with instrument.span("profs.match", len(faculty_to_dep)):
+        for faculty, dep in faculty_to_dep.items():
+            prof = prof_index.resolve(faculty)
+            if prof is not None:
+                # Enroll name : (rating, number of ratings, department)
+                profs_to_ratings[faculty] = (prof[2], prof[3], dep)
 
 
-def analyze():
+# Overall enrollment
+def analyze_overview(columns):
 
     print "\n===== Initial analysis =====\n"
     print "Number of courses:", len(courses)
     print "Number of courses filled to capacity:", len([t for t in targets if t >= 1])
     print "Average enrollment (allowing targets greater than 1):", sum(targets) / len(targets), "\n\n"
 
+
+# Average enrollment by department
+def analyze_departments(columns):
+
     # Construct department data structures
-    department_set = {course["department"] for course in courses}
+    course_deps = columns["department"]
+    department_set = set(course_deps)
     departments.extend(sorted(department_set))
     for i, dep in enumerate(departments):
         dep_map[dep] = i
 
     # Analyze average course enrollment rate by department
-    enrollment_by_dep = []
-    for dep in departments:
-        dep_targets = [targets[i] for i, course in enumerate(courses) if course["department"] == dep]
-        enrollment_by_dep.append((dep, sum(dep_targets) / len(dep_targets)))
+    dep_groups = groupby.group_by(course_deps, targets, departments)
+    enrollment_by_dep = zip(dep_groups.keys, dep_groups.mean.tolist())
     enrollment_by_dep.sort(key = lambda x : x[1], reverse = True)
     print "===== Average Course Enrollment by Department =====\n"
     for dep, enroll_rate in enrollment_by_dep:
@@ -108,55 +127,57 @@ def analyze():
         print dep, round(enroll_rate, 3),
     print "\n\n"
 
+
+# Average enrollment by distro
+def analyze_distros(columns):
+
     # Construct distro data structures
-    distro_set = set()
-    for course in courses:
-        for distro in course["requirements_met"].split("\n"):
-            if distro:
-                distro_set.add(distro)
+    course_distros = columns["distros"]
+    distro_set = {distro for distro_list in course_distros for distro in distro_list}
     distros.extend(sorted(distro_set))
     for i, distro in enumerate(distros):
         distro_map[distro] = i
 
     # Analyze average course enrollment rate by distro
-    enrollment_by_distro = []
-    for distro in distros:
-        distro_targets = [targets[i] for i, course in enumerate(courses) if distro in course["requirements_met"].split("\n")]
-        enrollment_by_distro.append((distro, sum(distro_targets) / len(distro_targets)))
+    distro_groups = groupby.group_by(course_distros, targets, distros, multi = True)
+    enrollment_by_distro = zip(distro_groups.keys, distro_groups.mean.tolist())
     enrollment_by_distro.sort(key = lambda x : x[1], reverse = True)
     print "===== Average Course Enrollment by Distro =====\n"
     for distro, enroll_rate in enrollment_by_distro:
         print distro, round(enroll_rate, 3),
     print "\n\n"
-    
+
+
+# Average enrollment by start time
+def analyze_starts(columns):
+
     # Construct start time data structures
-    start_set = {time_string_to_float(course["start_time"]) for course in courses}
+    course_starts = columns["start"]
+    start_set = set(course_starts)
     starts.extend(start_set)
     for i, start in enumerate(starts):
         start_map[start] = i
 
     # Analyze average course enrollment rate by start time
-    enrollment_by_start = []
-    for start in starts:
-      start_targets = [targets[i] for i, course in enumerate(courses) if start == time_string_to_float(course["start_time"])]
-      enrollment_by_start.append((start, sum(start_targets) / len(start_targets)))
+    start_groups = groupby.group_by(course_starts, targets, starts)
+    enrollment_by_start = zip(start_groups.keys, start_groups.mean.tolist())
     enrollment_by_start.sort(key = lambda x : x[0], reverse = True)
     print "===== Average Course Enrollment by Start (hours after 8am : enrollment) =====\n"
     for start, enroll_rate in enrollment_by_start:
       print start, round(enroll_rate, 3)
     print "\n\n"
 
+
+# Enrollment for the highest-rated professors
+def analyze_profs(columns):
+
     # Construct prof data structures
-    for course in courses:
-        for prof in profs:
-            if prof[0] in course["faculty"] and prof[1] in course["faculty"]:
-                # Enroll name : (rating, number of ratings, department)
-                profs_to_ratings[course["faculty"]] = (prof[2], prof[3], course["department"])
-    profs_to_targets = {}
-    for prof in profs_to_ratings.keys():
-        prof_targets = [targets[i] for i, course in enumerate(courses) if course["faculty"] == prof]
-        profs_to_targets[prof] = sum(prof_targets) / len(prof_targets)
-    prof_set = {course["faculty"] for course in courses}
+    match_profs()
+    course_faculty = columns["faculty"]
+    faculty_groups = groupby.group_by(course_faculty, targets)
+    faculty_to_target = dict(zip(faculty_groups.keys, faculty_groups.mean.tolist()))
+    profs_to_targets = {prof : faculty_to_target[prof] for prof in profs_to_ratings}
+    prof_set = set(course_faculty)
     for i, prof in enumerate(list(prof_set)):
         prof_map[prof] = i
 
@@ -176,22 +197,24 @@ def analyze():
     print sum(golden_prof_targets) / len(golden_prof_targets)
     print "\n\n"
 
+
+# Most-enrolled course by department
+def analyze_titles(columns):
+
     # Construct course data structures
-    title_set = {course["title"] for course in courses}
+    course_deps, course_titles = columns["department"], columns["title"]
+    title_set = set(course_titles)
     titles.extend(sorted(title_set))
     for i, title in enumerate(titles):
         title_map[title] = i
 
     # Find most-enrolled course by department
+    # (a title shared by several departments is filed under the last one listed)
+    title_groups = groupby.group_by(course_titles, targets, titles)
+    title_to_dep = dict(zip(course_titles, course_deps))
     enrollment_by_title = defaultdict(list)
-    for title in titles:
-        title_targets = []
-        department = ""
-        for i, course in enumerate(courses):
-            if course["title"] == title:
-                title_targets.append(targets[i])
-                department = course["department"]
-        enrollment_by_title[department].append((title, sum(title_targets) / len(title_targets)))
+    for title, enroll_rate in zip(title_groups.keys, title_groups.mean.tolist()):
+        enrollment_by_title[title_to_dep[title]].append((title, enroll_rate))
     print "===== Most-Enrolled Course by Department =====\n"
     for pair in enrollment_by_title.items():
         most_popular = pair[1]
@@ -199,32 +222,39 @@ def analyze():
         print pair[0], most_popular[0]
     print "\n"
 
+
+# Average enrollment by course duration
+def analyze_durations(columns):
+
     # Construct course duration data structures
-    duration_set = {round(time_string_to_float(course["end_time"]) - time_string_to_float(course["start_time"]), 2) for course in courses}
+    course_durations = columns["duration"]
+    duration_set = set(course_durations)
     durations = sorted(duration_set)
     for i, duration in enumerate(durations):
         duration_map[duration] = i
 
     # Analyze enrollment by course duration
-    enrollment_by_duration = []
-    for dur in durations:
-        dur_targets = []
-        for i, course in enumerate(courses):
-            if round(time_string_to_float(course["end_time"]) - time_string_to_float(course["start_time"]), 2) == dur:
-                dur_targets.append(targets[i])
-        enrollment_by_duration.append((dur, sum(dur_targets) / len(dur_targets)))
+    duration_groups = groupby.group_by(course_durations, targets, durations)
+    enrollment_by_duration = zip(duration_groups.keys, duration_groups.mean.tolist())
     enrollment_by_duration.sort(key = lambda x : x[0], reverse = True)
     print "===== Average Course Enrollment by Course Duration (hours : enrollment) =====\n"
     for dur, enroll_rate in enrollment_by_duration:
         print dur, round(enroll_rate, 3)
     print "\n"
 
+
+# Average enrollment by description sentiment
+def analyze_sentiment(columns):
+
     # Analyze course description sentiment
-    afinn = Afinn()
+    # (scores are cached by summary, so only descriptions not seen before get scored)
+    summaries = columns["summary"]
+    with instrument.span("sentiment.score", len(summaries)):
+        scores = score_summaries(summaries)
     sentiment_to_targets = defaultdict(list)
     upper_bounds = [-.025, -.02, -.015, -.01, -.005, 0, .005, .01, .015, .02, .025, .03]
-    for i, course in enumerate(courses):
-        sentiment = afinn.score(course["summary"]) / len(course["summary"])
+    for i, summary in enumerate(summaries):
+        sentiment = scores[i] / len(summary)
         for bound in upper_bounds:
             if sentiment < bound:
                 sentiment_to_targets[bound].append(targets[i])
@@ -234,131 +264,356 @@ def analyze():
         print item[0], len(item[1]), sum(item[1]) / len(item[1])
     print "\nMost course descriptions feature a slightly positive sentiment. No observable enrollment pattern.\n\n"
 
+
+# Average enrollment by description length
+def analyze_lengths(columns):
+
     # Analyze course description length
+    summaries, course_deps, course_titles = columns["summary"], columns["department"], columns["title"]
     lengths_to_targets = defaultdict(list)
     upper_bounds = [50, 100, 150, 200, 250, 300, 400, 500, 600, 700, 800, 900, 1000, 1100, 1200, 1300, 1400]
-    for i, course in enumerate(courses):
-        l = len(course["summary"])
+    for i, summary in enumerate(summaries):
+        l = len(summary)
         for bound in upper_bounds:
             if l < bound:
                 lengths_to_targets[bound].append(targets[i])
                 if bound < 150:
-                    print course["department"], course["title"]
+                    print course_deps[i], course_titles[i]
                 break
     print "===== Average Enrollment by Description Length (upper bound : # courses : enrollment) =====\n"
     for item in sorted(lengths_to_targets.items()):
         print item[0], len(item[1]), sum(item[1]) / len(item[1])
     print "\n"
 
+
+# Average enrollment by description key word
+def analyze_keywords(columns):
+
     # Analyze key words in course descriptions
-    words_to_targets = defaultdict(list)
     key_words = ["sex", "gender", "collab", "internet", "food", "introduction", "asia", "europe", "africa", "middle east", "america", "advanced", "essay", "assignment", "science", "novel", "non-fiction", "data", "love", "democracy", "project", "team"]
     # key_words = ["extra time"]
-    for word in key_words:
-        for i, course in enumerate(courses):
-            if word in course["summary"].lower():
-                words_to_targets[word].append(targets[i])
-                # print course["department"], course["title"]
+    summaries = columns["summary"]
+    # The index over HTML-stripped summaries is saved, and reused until the courses change
+    with instrument.span("keywords.index", len(summaries)):
+        keyword_index = KeywordIndex.load_or_build(summaries)
     print "===== Average Enrollment by Description Key Word (word : # descriptions : enrollment) =====\n"
-    word_target_items = words_to_targets.items()
-    word_target_items.sort(key = lambda x : sum(x[1]) / len(x[1]), reverse = True)
-    for item in word_target_items:
-        print item[0], len(item[1]), sum(item[1]) / len(item[1])
+    word_stats = keyword_index.keyword_stats(key_words, targets)
+    word_stats.sort(key = lambda x : x[2], reverse = True)
+    for word, count, enroll_rate in word_stats:
+        print word, count, enroll_rate
     print "\n"
 
-def test_model(matrix, model):
 
-    test_errors = []
+# Every analyze() section, in report order
+ANALYZE_SECTIONS = [analyze_overview, analyze_departments, analyze_distros, analyze_starts, analyze_profs,
+                    analyze_titles, analyze_durations, analyze_sentiment, analyze_lengths, analyze_keywords]
 
-    # Ten iterations of 80/20 cross-validation
-    for _ in range(10):
-    
-        # Randomly partition about 80% of the data for training and the remaining for testing
-        training_matrix, training_targets, test_matrix, test_targets = [], [], [], []
-        for i in range(len(targets)):
-            if random.random() < .8:
-                training_matrix.append(matrix[i])
-                training_targets.append(targets[i])
-            else:
-                test_matrix.append(matrix[i])
-                test_targets.append(targets[i])
-
-        # Train and predict on test data
-        model.fit(training_matrix, training_targets)
-        test_predictions = model.predict(test_matrix)
-        test_errors.append(metrics.mean_absolute_error(test_targets, test_predictions))
-    
-    print "Minimum mean error over ten models:", min(test_errors), "\n\n"
-
-
-def predict():
-
-    # Construct training matrix
-    matrix = np.zeros((len(courses), 11))
-    for i, course in enumerate(courses):
-        
-        # Column 0: Department classification
-        # Single-var random tree absolute error: .190
-        matrix[i][0] = dep_map[course["department"]] 
-        
-        # Columns 1 - 4: Possible distros
-        # Single-var random tree absolute error: .217
-        course_distros = course["requirements_met"].split("\n")
-        course_distros = filter(lambda distro : distro, course_distros)
-        for j, distro in enumerate(course_distros):
-            matrix[i][1 + j] = distro_map[distro] 
-
-        # Column 5: Start time
-        # Single-var random tree absolute error: .214
-        matrix[i][5] = start_map[time_string_to_float(course["start_time"])] 
-
-        # Columns 6 and 7: RateMyProfessors data
-        try:
-            prof = profs_to_ratings[course["faculty"]]
-            matrix[i][6] = prof[0] # Single-var linreg error: .224
-            matrix[i][7] = prof[1] # Single-var linreg error: .232
-        except:
-            pass
-
-        # Column 8: Course title
-        # Single-var random tree absolute error: .183
-        matrix[i][8] = title_map[course["title"]]
-
-        # Column 9: Course duration
-        # Single-var linreg error: .231
-        matrix[i][9] = round(time_string_to_float(course["end_time"]) - time_string_to_float(course["start_time"]), 2) 
-
-        # Column 10: Professor
-        # Single-var random tree absolute error: .184
-        matrix[i][10] = prof_map[course["faculty"]]
-
-    # Standardize the data: center columns at 0 and divide by variance
-    for i in range(len(matrix[0])):
-        column = np.array(matrix)[:, i]
-        column_mean = sum(column) / len(column)
-        column_std = np.std(column)
-        for j in range(len(matrix)):
-            matrix[j][i] -= column_mean
-            matrix[j][i] /= column_std
-
-    print "===== Random Forest Regressor Results =====\n"
-    test_model(matrix, RandomForestRegressor(n_estimators = 50, oob_score = True))
-
-    print "===== Multilayer Perceptron Results =====\n"
-    test_model(matrix, MLPRegressor(hidden_layer_sizes=(100, 10)))
-
-    print "===== Support Vector Machine Results =====\n"
-    test_model(matrix, svm.SVR())
-
-    test_model(matrix, linear_model.LinearRegression())
-
-def main():
-    
-    initialize_data()
-    analyze()
-    predict()
-    
-main()
+
+# The course columns the analyze sections share
+def analysis_columns():
+    return {
+        "department": courses.column("department"),
+        "distros": courses.distros(),
+        "start": schedule_columns["start"],
+        "duration": schedule_columns["duration"],
+        "faculty": courses.column("faculty"),
+        "title": courses.column("title"),
+        "summary": courses.column("summary"),
+    }
+
+
+def analyze():
+    with instrument.span("analyze.columns", len(courses)):
+        columns = analysis_columns()
+    for section in ANALYZE_SECTIONS:
+        with instrument.span(section.__name__.replace("_", ".", 1), len(courses)):
+            section(columns)
+
+
+# Per-course input columns for features.FeaturePipeline
+def course_columns(table):
+    times = schedule_columns if table is courses and schedule_columns else schedule.columns(table)
+    return {
+        "department": table.column("department"),
+        "distros": table.distros(),
+        "start": times["start"],
+        "duration": times["duration"],
+        "title": table.column("title"),
+        "faculty": table.column("faculty"),
+    }
+
+
+# Standardised training matrix (see features.py for the columns), loaded from the feature
+# cache if these courses and ratings were seen before
+def training_matrix():
+    with instrument.span("features.matrix", len(courses)):
+        pipeline, matrix = features.cached_fit_transform(course_columns(courses), profs_to_ratings)
+    return matrix
+
+
+# Cross-validates the candidate models on the past terms
+def evaluate():
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.neural_network import MLPRegressor
+    from sklearn import linear_model, svm
+
+    matrix = training_matrix()
+
+    # Ten fixed-seed 80/20 splits per model, all models cross-validated together across cores
+    models = OrderedDict([
+        ("Random Forest Regressor", RandomForestRegressor(n_estimators = 50, oob_score = True)),
+        ("Multilayer Perceptron", MLPRegressor(hidden_layer_sizes=(100, 10))),
+        ("Support Vector Machine", svm.SVR()),
+        ("Linear Regression", linear_model.LinearRegression()),
+    ])
+    with instrument.span("cv.cross_validate", len(models)):
+        results = cv.cross_validate(matrix, targets, models)
+    cv.report(results)
+
+# Tunes the random forest by successive halving instead of running the fixed models
+def search(time_budget = 300, tree_budget = None):
+    matrix = training_matrix()
+    with instrument.span("search.successive_halving"):
+        leaderboard = search_module.successive_halving(matrix, targets, time_budget = time_budget, tree_budget = tree_budget)
+    search_module.report(leaderboard)
+
+
+# Fits the enrollment model on the past terms and saves it for predict()
+def train():
+    with instrument.span("train.fit", len(courses)):
+        artifact = model_artifact.train(course_columns(courses), targets, profs,
+                                        {"courses": len(courses), "terms": len(set(courses.column("term")))})
+    with instrument.span("train.save"):
+        artifact.save()
+    print "Trained on", len(courses), "courses, saved to", model_artifact.ARTIFACT_PATH
+
+
+# Scores a future term file with the saved model, without reading the past terms
+def predict(path = "Carleton Data - Future Terms/course_data_18SP.json"):
+    start = time.time()
+    with instrument.span("predict.load_model"):
+        artifact = model_artifact.Artifact.load()
+    with instrument.span("predict.load_term") as span:
+        term_courses, _, dropped = loader.load_term(path)
+        span.items = len(term_courses)
+    with instrument.span("predict.score", len(term_courses)):
+        predictions = artifact.predict(course_columns(term_courses))
+    elapsed = time.time() - start
+
+    print "===== Predicted Enrollment (course : title : fill rate : seats) =====\n"
+    for course, prediction in sorted(zip(term_courses, predictions.tolist()), key = lambda x : x[0]["course_num"]):
+        print course["course_num"], course["title"].strip(), round(prediction, 3), int(round(prediction * float(course["size"])))
+    print "\nScored", len(term_courses), "courses in %.3fs (load model, read term, predict);" % elapsed, sum(dropped.values()), "dropped by loader.RULES\n"
+
+
+# Trains incremental models one term file at a time and scores a held-out term
+def stream(holdout = None, epochs = 1, compare = False):
+    load_ratings()
+    with instrument.span("stream.train"):
+        result = streaming.train("Carleton Data - Past Terms", profs, course_columns, holdout, epochs, compare = compare)
+    streaming.report(result)
+
+
+# Folds term files into the running aggregates; terms already ingested from an unchanged
+# file are skipped and changed ones are retracted and re-ingested
+def ingest(paths):
+    maintained = aggregates.Aggregates()
+    for path in paths:
+        with instrument.span("aggregates.ingest") as span:
+            term_courses, term_targets, _ = loader.load_term(path)
+            term = os.path.basename(path)[len("course_data_"):-len(".json")]
+            changed = maintained.ingest(term, course_columns(term_courses), term_targets, course_store.file_sha1(path))
+            span.items = len(term_courses)
+        if changed:
+            print "Ingested", term, len(term_courses), "courses"
+
+
+def retract(terms):
+    maintained = aggregates.Aggregates()
+    for term in terms:
+        maintained.retract(term)
+        print "Retracted", term
+
+
+# The enrollment breakdowns, read from the running aggregates instead of the term files
+def report():
+    maintained = aggregates.Aggregates()
+    # Nothing ingested yet, everything retracted, or only terms with no courses kept
+    overall = maintained.means("all")
+    if not overall:
+        print "No courses have been ingested; run ingest first"
+        return
+    [(_, mean, count)] = overall
+    print "\n===== Enrollment over", len(maintained.terms), "ingested terms =====\n"
+    print "Number of courses:", count
+    print "Average enrollment (allowing targets greater than 1):", mean, "\n\n"
+
+    for name, title in [("department", "Department"), ("distro", "Distro")]:
+        print "===== Average Course Enrollment by %s =====\n" % title
+        for key, mean, _ in sorted(maintained.means(name), key = lambda x : x[1], reverse = True):
+            print key, round(mean, 3),
+        print "\n\n"
+
+    print "===== Average Course Enrollment by Start (hours after 8am : enrollment) =====\n"
+    for start, mean, _ in sorted(maintained.means("start"), reverse = True):
+        print start, round(mean, 3)
+    print "\n\n"
+
+    print "===== Most-Enrolled Course by Department =====\n"
+    best = {}
+    for (dep, title), mean, _ in maintained.means("title"):
+        if dep not in best or mean > best[dep][1]:
+            best[dep] = (title, mean)
+    for dep in sorted(best):
+        print dep, best[dep]
+    print "\n"
+
+    print "===== Average Course Enrollment by Course Duration (hours : enrollment) =====\n"
+    for duration, mean, _ in sorted(maintained.means("duration"), reverse = True):
+        print duration, round(mean, 3)
+    print "\n"
+
+
+# Serves the enrollment cube over the past terms as JSON on localhost (see cube.py)
+def serve(port = 8000, cache_size = 1024):
+    with instrument.span("cube.build", len(courses)):
+        columns = course_columns(courses)
+        columns["term"] = courses.column("term")
+        enrollment_cube = cube.Cube(columns, targets)
+    server = cube.make_server(enrollment_cube, port = port, cache_size = cache_size)
+    print "Serving", len(enrollment_cube), "cells over", len(courses), "courses at http://%s:%d/" % server.server_address
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# Prints courses loaded and dropped, warming the term stores on the way
+def load():
+    print len(courses), "courses,", len(profs), "RateMyProfessors entries"
+    for rule, count in excluded.items():
+        print "Dropped", count, rule
+
+
+# Times a cold import of this module and each stage, with the reports sent to /dev/null
+def bench():
+    script = "import time; start = time.time(); import isaac, sys; print time.time() - start, 'sklearn' in sys.modules"
+    seconds, sklearn_loaded = subprocess.check_output([sys.executable, "-c", script]).split()
+    timings = OrderedDict([("import isaac", float(seconds))])
+
+    stdout = sys.stdout
+    sys.stdout = codecs.open(os.devnull, "w", "utf-8")
+    try:
+        for name, stage in [("load", initialize_data), ("analyze", analyze), ("feature matrix", training_matrix),
+                            ("import sklearn", lambda : __import__("sklearn.ensemble"))]:
+            start = time.time()
+            stage()
+            timings[name] = time.time() - start
+    finally:
+        sys.stdout = stdout
+
+    print "===== Stage Timings (stage : ms) =====\n"
+    for name, seconds in timings.items():
+        print name, int(seconds * 1000)
+    print "\nImporting isaac loads sklearn:", sklearn_loaded, "\n"
+
+
+COMMANDS = OrderedDict([
+    ("load", "load the past terms and RateMyProfessors data and report what was dropped"),
+    ("analyze", "print the enrollment breakdowns"),
+    ("evaluate", "cross-validate the candidate models"),
+    ("search", "tune the random forest by successive halving"),
+    ("train", "fit the enrollment model and save it"),
+    ("predict", "score a future term file with the saved model"),
+    ("bench", "time imports and each stage"),
+    ("stream", "train incremental models term by term and score a held-out term"),
+    ("ingest", "fold new or re-scraped term files into the running aggregates"),
+    ("retract", "remove terms from the running aggregates"),
+    ("report", "print the enrollment breakdowns from the running aggregates"),
+    ("serve", "answer enrollment cube queries over HTTP"),
+])
+
+
+def run(args):
+    # Only these commands run without the past terms in memory
+    if args.command == "predict":
+        predict(args.path)
+    elif args.command == "bench":
+        bench()
+    elif args.command == "stream":
+        stream(args.holdout, args.epochs, args.compare)
+    elif args.command == "ingest":
+        ingest(args.paths or course_store.source_files("Carleton Data - Past Terms"))
+    elif args.command == "retract":
+        retract(args.terms)
+    elif args.command == "report":
+        report()
+    else:
+        initialize_data()
+        if args.command in ("search", "train", "evaluate"):
+            match_profs()
+        if args.command == "serve":
+            serve(args.port, args.cache_size)
+        elif args.command == "search":
+            search(args.time_budget, args.tree_budget)
+        else:
+            {"load": load, "analyze": analyze, "evaluate": evaluate, "train": train}[args.command]()
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Carleton course enrollment analysis and prediction")
+    parser.add_argument("--timing", action = "store_true", help = "print startup and command time to stderr")
+    parser.add_argument("--profile", metavar = "PATH", help = "record stage spans and write them to PATH as JSON")
+    parser.add_argument("--trace", metavar = "PATH", help = "record stage spans and write a Chrome trace to PATH")
+    parser.add_argument("--collapsed", metavar = "PATH", help = "record stage spans and write collapsed stacks to PATH")
+    parser.add_argument("--trace-memory", action = "store_true", help = "measure span memory with tracemalloc, where available")
+    subparsers = parser.add_subparsers(dest = "command")
+    for command, description in COMMANDS.items():
+        subparser = subparsers.add_parser(command, help = description)
+        if command == "predict":
+            subparser.add_argument("path", nargs = "?", default = "Carleton Data - Future Terms/course_data_18SP.json")
+        elif command == "search":
+            subparser.add_argument("--time-budget", type = float, default = 300, help = "seconds before the search stops (default: 300)")
+            subparser.add_argument("--tree-budget", type = int, help = "trees fitted before the search stops (default: no limit)")
+        elif command == "stream":
+            subparser.add_argument("--holdout", help = "term to hold out, e.g. 17_3 (default: the last term)")
+            subparser.add_argument("--epochs", type = int, default = 1)
+            subparser.add_argument("--compare", action = "store_true", help = "also score the in-memory random forest")
+        elif command == "ingest":
+            subparser.add_argument("paths", nargs = "*", help = "term files (default: every past term)")
+        elif command == "retract":
+            subparser.add_argument("terms", nargs = "+", help = "terms as ingest names them from the file names, such as 17_3")
+        elif command == "serve":
+            subparser.add_argument("--port", type = int, default = 8000)
+            subparser.add_argument("--cache-size", type = int, default = 1024, help = "query results kept in the LRU cache")
+    args = parser.parse_args(argv)
+    # Faculty names aren't ASCII, and a piped stdout has no encoding to print them with
+    if sys.stdout.encoding is None:
+        sys.stdout = codecs.getwriter("utf-8")(sys.stdout)
+    started = time.time()
+    profiling = args.profile or args.trace or args.collapsed
+    if profiling:
+        instrument.enable(args.trace_memory)
+
+    with instrument.span(args.command):
+        run(args)
+
+    if profiling:
+        instrument.report()
+        if args.profile:
+            instrument.write_json(args.profile)
+        if args.trace:
+            instrument.write_chrome_trace(args.trace)
+        if args.collapsed:
+            instrument.write_collapsed(args.collapsed)
+    if args.timing:
+        print >> sys.stderr, "startup %dms, %s %dms" % ((started - STARTED) * 1000, args.command, (time.time() - started) * 1000)
+
+
+if __name__ == "__main__":
+    main()
 
 '''
 ************************* MODEL *************************
@@ -0,0 +1,130 @@
+from __future__ import division
+from HTMLParser import HTMLParser
+from bisect import bisect_right
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+# Inverted index for substring keyword search over course summaries.
+#
+# Summaries are HTML-stripped, unescaped, lowercased and whitespace-collapsed, then
+# deduplicated (most descriptions repeat across terms). Each distinct summary is a
+# document; each whitespace-separated token maps to the documents containing it.
+# A keyword matches a course when it is a substring of the course's normalised summary,
+# as "word in summary.lower()" always did: every part of the keyword must be a substring
+# of some token in the document, which narrows the candidates through the index, and the
+# few candidates left are checked against the full text. Token lookups search the whole
+# vocabulary in one str.find pass, so a keyword costs microseconds, not a scan of every
+# summary.
+
+INDEX_PATH = ".keyword_index.json"
+
+_html = HTMLParser()
+
+
+def normalize(summary):
+    text = re.sub(r"<[^>]*>", " ", summary)
+    return " ".join(_html.unescape(text).lower().split())
+
+
+def corpus_hash(summaries):
+    digest = hashlib.sha1()
+    for summary in summaries:
+        digest.update(summary.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class KeywordIndex(object):
+
+    def __init__(self, corpus, docs, doc_of_course, vocab, postings):
+        self.corpus = corpus
+        self.docs = docs
+        self.doc_of_course = np.asarray(doc_of_course, dtype = np.intp)
+        self.vocab = vocab
+        self.postings = postings
+        # All tokens in one string, so a substring search over the vocabulary is one str.find loop
+        self.vocab_text = "\n".join(vocab) + "\n"
+        self.vocab_offsets = np.cumsum([0] + [len(token) + 1 for token in vocab[:-1]]).tolist()
+        # Courses sharing each document, in course order
+        order = np.argsort(self.doc_of_course, kind = "mergesort")
+        bounds = np.searchsorted(self.doc_of_course[order], np.arange(len(docs) + 1))
+        self.courses_of_doc = [order[bounds[d]:bounds[d + 1]] for d in range(len(docs))]
+
+    @classmethod
+    def build(cls, summaries):
+        docs, doc_ids, doc_of_course = [], {}, []
+        for summary in summaries:
+            text = normalize(summary)
+            if text not in doc_ids:
+                doc_ids[text] = len(docs)
+                docs.append(text)
+            doc_of_course.append(doc_ids[text])
+        postings = {}
+        for d, text in enumerate(docs):
+            for token in set(text.split()):
+                postings.setdefault(token, []).append(d)
+        vocab = sorted(postings)
+        return cls(corpus_hash(summaries), docs, doc_of_course, vocab, [postings[token] for token in vocab])
+
+    def save(self, path = INDEX_PATH):
+        with open(path, "w") as f:
+            json.dump({"corpus": self.corpus, "docs": self.docs, "doc_of_course": self.doc_of_course.tolist(),
+                       "vocab": self.vocab, "postings": self.postings}, f)
+
+    @classmethod
+    def load(cls, path = INDEX_PATH):
+        with open(path) as f:
+            index = json.load(f)
+        return cls(index["corpus"], index["docs"], index["doc_of_course"], index["vocab"], index["postings"])
+
+    # The saved index if it was built from these summaries, otherwise a freshly built (and saved) one
+    @classmethod
+    def load_or_build(cls, summaries, path = INDEX_PATH):
+        if os.path.exists(path):
+            index = cls.load(path)
+            if index.corpus == corpus_hash(summaries):
+                return index
+        index = cls.build(summaries)
+        index.save(path)
+        return index
+
+    # Documents with a token containing part
+    def _docs_containing(self, part):
+        # An empty keyword is in every summary (and find("") would never run out)
+        if not part:
+            return set(range(len(self.docs)))
+        docs = set()
+        start = self.vocab_text.find(part)
+        while start != -1:
+            token = bisect_right(self.vocab_offsets, start) - 1
+            docs.update(self.postings[token])
+            # Skip to the next token; each token's documents only need adding once
+            start = self.vocab_text.find(part, self.vocab_offsets[token + 1] if token + 1 < len(self.vocab) else len(self.vocab_text))
+        return docs
+
+    # Positions of the courses whose normalised summary contains keyword, in course order
+    def courses_matching(self, keyword):
+        keyword = " ".join(keyword.lower().split())
+        candidates = None
+        for part in keyword.split(" "):
+            docs = self._docs_containing(part)
+            candidates = docs if candidates is None else candidates & docs
+        matches = [self.courses_of_doc[d] for d in candidates or () if keyword in self.docs[d]]
+        if not matches:
+            return np.zeros(0, dtype = np.intp)
+        return np.sort(np.concatenate(matches))
+
+    # (keyword, number of courses, mean target) for each keyword that matches any course.
+    # Targets are summed in course order, so means match sum(list) / len(list) exactly.
+    def keyword_stats(self, keywords, targets):
+        targets = np.asarray(targets, dtype = np.float64)
+        stats = []
+        for keyword in keywords:
+            matches = self.courses_matching(keyword)
+            if len(matches):
+                stats.append((keyword, len(matches), sum(targets[matches].tolist()) / len(matches)))
+        return stats
@@ -0,0 +1,80 @@
+from __future__ import division
+from collections import OrderedDict
+from multiprocessing import Pool, cpu_count
+import numpy as np
+import course_store
+from course_table import CourseTable
+
+# Since we're predicting on multiple variables in the same matrix,
+# we'll want to make sure that all of our courses have all of said variables
+REQUIRED_FIELDS = ["start_time", "end_time", "department", "requirements_met",
+                   "registered", "size", "faculty", "title"]
+
+# Exclusion rules, in the order a dropped course is attributed to them:
+#   incomplete        missing a prediction variable, or no seats
+#   malformed         no credits listed, or an unreadable registered count
+#   argument_inquiry  Argument & Inquiry Seminars
+#   pe                PE classes
+#   lab               labs, other than music and six-credit courses
+RULES = ["incomplete", "malformed", "argument_inquiry", "pe", "lab"]
+
+
+# Evaluates every exclusion rule over a term's columns at once. Rules on strings are
+# decided once per distinct value and then broadcast through the dictionary codes.
+def exclusion_masks(store):
+    incomplete = ~(store.size > 0)
+    for field in REQUIRED_FIELDS:
+        incomplete |= store.vocab_mask(field, lambda value : value == "n/a", missing = True)
+    offsets = store.summary_offsets
+    summary_na = [store.summary_blob[offsets[j]:offsets[j + 1]].tostring() == b"n/a" for j in range(len(offsets) - 1)]
+    incomplete |= np.array(summary_na + [True], dtype = bool)[store.summary_codes]
+
+    malformed = store.vocab_mask("credits", lambda credits : not credits, missing = True) | np.isnan(store.registered)
+
+    is_ai = store.vocab_mask("requirements_met", lambda distros : "Argument & Inquiry Seminar" in distros.split("\n"))
+    is_pe = store.vocab_mask("department", lambda dep : dep == "PE")
+
+    lab_in_title = store.vocab_mask("title", lambda title : "Lab" in title)
+    is_music = store.vocab_mask("department", lambda dep : dep == "MUSC")
+    six_credits = store.vocab_mask("credits", lambda credits : credits[:1] == "6")
+    is_lab = lab_in_title & ~is_music & ~six_credits
+
+    return OrderedDict(zip(RULES, [incomplete, malformed, is_ai, is_pe, is_lab]))
+
+
+# Loads one term file: opens its columnar partition, applies the exclusion rules to the
+# columns, and keeps only the courses that pass. Returns the courses as a CourseTable, their
+# enrollment targets (registered / size) and how many courses each rule dropped.
+def load_term(source_path):
+    store = course_store.load_term(source_path)
+    dropped = np.zeros(len(store), dtype = bool)
+    counts = OrderedDict()
+    for rule, mask in exclusion_masks(store).items():
+        counts[rule] = int(np.count_nonzero(mask & ~dropped))
+        dropped |= mask
+    keep = np.flatnonzero(~dropped)
+    targets = np.asarray(store.registered)[keep] / np.asarray(store.size)[keep]
+    return CourseTable.from_store(store, keep), targets, counts
+
+
+# Loads every term file in source_dir across a process pool. Courses come back in the
+# usual term order, with one targets array and per-rule drop counts summed over terms.
+def load_terms(source_dir, processes = None):
+    paths = course_store.source_files(source_dir)
+    processes = min(processes or cpu_count(), len(paths))
+    if processes > 1:
+        pool = Pool(processes)
+        try:
+            results = pool.map(load_term, paths)
+        finally:
+            pool.close()
+    else:
+        results = map(load_term, paths)
+
+    courses, counts = CourseTable(), OrderedDict((rule, 0) for rule in RULES)
+    for term_courses, _, term_counts in results:
+        courses.extend(term_courses)
+        for rule, count in term_counts.items():
+            counts[rule] += count
+    targets = np.concatenate([term_targets for _, term_targets, _ in results]) if results else np.zeros(0)
+    return courses, targets, counts
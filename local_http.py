@@ -0,0 +1,46 @@
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+import threading
+
+# Small HTTP servers on localhost: the stub Enroll server the scraper benchmarks run
+# against (bench.serve_pages) and the enrollment cube's query server (cube.make_server).
+#
+# Each connection gets its own thread, so one keep-alive client doesn't hold up the
+# others. Handlers send each response in one write with Nagle's algorithm off, so
+# keep-alive clients don't stall on delayed ACKs, and don't log every request.
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    # Sends a whole response; headers is a list of extra (name, value) pairs
+    def send(self, status, body = "", content_type = None, headers = ()):
+        self.send_response(status)
+        if content_type is not None:
+            self.send_header("Content-Type", content_type)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Serves with handler on host:port (any free port for 0). With background, serve_forever
+# runs in a daemon thread and the server is returned at once; shut it down with
+# server.shutdown() and server.server_close().
+def make_server(handler, host = "127.0.0.1", port = 0, background = False):
+    server = ThreadingHTTPServer((host, port), handler)
+    if background:
+        thread = threading.Thread(target = server.serve_forever)
+        thread.daemon = True
+        thread.start()
+    return server
@@ -0,0 +1,76 @@
+from __future__ import division
+import cPickle as pickle
+import time
+
+import numpy as np
+import atomic_file
+from features import FeaturePipeline
+from prof_index import ProfIndex
+
+# Trained enrollment model saved for scoring future terms.
+#
+# An artifact holds everything needed to score a term file without the past terms: the
+# fitted forest, the feature pipeline's encoders and scaling statistics, and the
+# RateMyProfessors entries used to rate faculty. FORMAT_VERSION changes whenever that
+# layout does; load() refuses artifacts written in another format, so a stale file is
+# retrained instead of silently mis-scoring.
+
+FORMAT_VERSION = 1
+ARTIFACT_PATH = "enrollment_model.pkl"
+
+# Winning settings from search.successive_halving on the past terms
+MODEL_SETTINGS = {"n_estimators": 270, "max_features": .5, "max_depth": 20, "min_samples_leaf": 2}
+
+
+class Artifact(object):
+
+    def __init__(self, model, pipeline, profs, trained_on, created = None):
+        self.model = model
+        self.pipeline = pipeline
+        self.profs = profs
+        self.trained_on = trained_on
+        self.created = created or time.time()
+        self._prof_index = None
+
+    # RateMyProfessors (rating, number of ratings) for each faculty string matched to a prof
+    def ratings(self, faculty):
+        if self._prof_index is None:
+            self._prof_index = ProfIndex(self.profs)
+        ratings = {}
+        for name in set(faculty):
+            prof = self._prof_index.resolve(name)
+            if prof is not None:
+                ratings[name] = (prof[2], prof[3])
+        return ratings
+
+    # Predicted fill rate for every course in columns, in one batch
+    def predict(self, columns):
+        matrix = self.pipeline.transform(columns, self.ratings(columns["faculty"]))
+        return self.model.predict(matrix)
+
+    def save(self, path = ARTIFACT_PATH):
+        state = {"version": FORMAT_VERSION, "model": self.model, "pipeline": self.pipeline.to_dict(),
+                 "profs": self.profs, "trained_on": self.trained_on, "created": self.created}
+        with atomic_file.replace(path, "wb") as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path = ARTIFACT_PATH):
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != FORMAT_VERSION:
+            raise ValueError("%s has format version %s, expected %s; retrain it" % (path, state.get("version"), FORMAT_VERSION))
+        return cls(state["model"], FeaturePipeline.from_dict(state["pipeline"]), state["profs"],
+                   state["trained_on"], state["created"])
+
+
+# Fits the forest on the training columns and returns the artifact. trained_on describes
+# the training data (e.g. the number of courses and terms) for the record.
+def train(columns, targets, profs, trained_on, settings = MODEL_SETTINGS):
+    from sklearn.ensemble import RandomForestRegressor
+    artifact = Artifact(None, FeaturePipeline(), profs, trained_on)
+    ratings = artifact.ratings(columns["faculty"])
+    matrix = artifact.pipeline.fit_transform(columns, ratings)
+    artifact.model = RandomForestRegressor(n_jobs = -1, random_state = 0, **settings)
+    artifact.model.fit(matrix, np.asarray(targets, dtype = np.float64))
+    return artifact
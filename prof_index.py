@@ -0,0 +1,56 @@
+from collections import defaultdict
+import unicodedata
+import re
+
+# Matches Enroll faculty strings to RateMyProfessors entries.
+#
+# Names are normalised to lowercase ASCII word tokens (u"Hern\xe1ndez" -> "hernandez",
+# "Liben-Nowell" -> "liben", "nowell"). Professors are indexed by the last token of their
+# last name, so each instructor only looks at the handful of professors sharing one of
+# its tokens. A professor matches when their whole last name appears as consecutive
+# tokens and a token before it is their first name, or is its initial on its own ("A
+# Montero" for "Alfred Montero"). Prefixes and substrings don't count, so "Lee" doesn't
+# match "Leeds" and "Al" doesn't match "Alice Montero".
+
+
+def name_tokens(name):
+    if isinstance(name, str):
+        name = name.decode("utf-8")
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").lower()
+    return re.findall(r"[a-z0-9]+", ascii_name.replace("'", ""))
+
+
+class ProfIndex(object):
+
+    # profs: (first, last, rating, number of ratings) tuples. When several professors match
+    # the same faculty string the one latest in this list wins, as it always has; profs
+    # is sorted by rating and then number of ratings, so that is the best-rated match.
+    def __init__(self, profs):
+        self.profs = profs
+        self.by_last_name = defaultdict(list)
+        for position, prof in enumerate(profs):
+            first, last = name_tokens(prof[0]), name_tokens(prof[1])
+            if first and last:
+                self.by_last_name[last[-1]].append((position, first, last))
+        self.resolved = {}
+
+    # Position in profs of the best match for one instructor's name, or -1
+    def match_instructor(self, name):
+        tokens = name_tokens(name)
+        best = -1
+        for end, token in enumerate(tokens):
+            for position, first, last in self.by_last_name.get(token, ()):
+                start = end - len(last) + 1
+                if start > 0 and tokens[start:end + 1] == last and any(
+                        token == first[0] or token == first[0][0] for token in tokens[:start]):
+                    best = max(best, position)
+        return best
+
+    # The profs entry for an Enroll faculty string, or None. Comma-separated instructors
+    # are matched one by one; each distinct faculty string is only resolved once.
+    def resolve(self, faculty):
+        if faculty not in self.resolved:
+            positions = [self.match_instructor(name) for name in faculty.split(",")]
+            self.resolved[faculty] = max(positions) if positions else -1
+        position = self.resolved[faculty]
+        return self.profs[position] if position >= 0 else None
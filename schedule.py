@@ -0,0 +1,114 @@
+from __future__ import division
+import json
+
+import numpy as np
+import course_store
+
+# Start and end times as integer minutes after 8am, parsed once per distinct string.
+#
+# Times are dictionary-coded in a CourseTable, so a column is parsed by parsing its
+# vocabulary and gathering through the codes. Parsed strings are also memoized for the
+# whole process, so the past terms, a future term and any later table share the work.
+# The analysis and the features use hours after 8am as isaac.time_string_to_float
+# computes them, including its quirks ("7:30am" is -1.5). legacy_hours reproduces that
+# from integer minutes, memoized per minute value, and verify() checks it against the
+# original over every time string in the data.
+
+_minutes = {}
+_hours = {}
+_durations = {}
+
+
+# Minutes after 8am for an Enroll time string such as "10:10am". Raises ValueError for a
+# string that isn't a time, as time_string_to_float does.
+def minutes(time):
+    if time not in _minutes:
+        try:
+            hour, minute = time.split(":")
+            hour, ampm, minute = int(hour) % 12, minute[-2:], int(minute[:2])
+        except (ValueError, AttributeError):
+            raise ValueError("not a time: %r" % (time,))
+        if ampm == "pm":
+            hour += 12
+        _minutes[time] = (hour - 8) * 60 + minute
+    return _minutes[time]
+
+
+# isaac.time_string_to_float of the time minutes after 8am: the whole hours joined to the
+# minutes as a fraction of an hour rounded to 3 places, digit strings and all
+def legacy_hours(minutes):
+    if minutes not in _hours:
+        hour, minute = divmod(minutes, 60)
+        _hours[minutes] = float(str(hour) + str(round(minute / 60, 3))[1:])
+    return _hours[minutes]
+
+
+# Course length in hours as the analysis rounds it
+def legacy_duration(start, end):
+    if (start, end) not in _durations:
+        _durations[start, end] = round(legacy_hours(end) - legacy_hours(start), 2)
+    return _durations[start, end]
+
+
+# Codes of a time field as minutes, parsing only the vocabulary
+def _minutes_column(courses, field):
+    codes, vocab = courses.encoded(field)
+    if np.any(codes < 0):
+        raise ValueError("a course has no %s" % field)
+    return np.array([minutes(time) for time in vocab], dtype = np.int32)[codes]
+
+
+# Schedule columns of a CourseTable, every course of which has a start and end time:
+# start and duration in hours after 8am (lists of floats, as course_columns gives them)
+def columns(courses):
+    start, end = _minutes_column(courses, "start_time"), _minutes_column(courses, "end_time")
+    # Hours once per distinct start, and durations once per distinct (start, end) pair
+    starts, start_inverse = np.unique(start, return_inverse = True)
+    pairs, pair_inverse = np.unique(start.astype(np.int64) * 2 ** 16 + (end + 2 ** 15), return_inverse = True)
+    start_hours = np.array([legacy_hours(minutes) for minutes in starts.tolist()], dtype = np.float64)
+    pair_durations = np.array([legacy_duration(pair // 2 ** 16, pair % 2 ** 16 - 2 ** 15) for pair in pairs.tolist()],
+                              dtype = np.float64)
+    return {
+        "start": start_hours[start_inverse].tolist(),
+        "duration": pair_durations[pair_inverse].tolist(),
+    }
+
+
+SOURCE_DIRS = ["Carleton Data - Past Terms", "Carleton Data - Future Terms"]
+
+
+# Every listed start and end time in the term files under source_dirs, and every
+# (start, end) pair
+def time_strings(source_dirs = SOURCE_DIRS):
+    times, pairs = set(), set()
+    for source_dir in source_dirs:
+        for path in course_store.source_files(source_dir):
+            with open(path) as f:
+                for course in json.load(f)["course_info"]:
+                    start, end = course.get("start_time", "n/a"), course.get("end_time", "n/a")
+                    times.update(time for time in (start, end) if time != "n/a")
+                    if start != "n/a" and end != "n/a":
+                        pairs.add((start, end))
+    return sorted(times), sorted(pairs)
+
+
+# Checks legacy_hours and legacy_duration against reference (isaac.time_string_to_float)
+# over every time string and pair in the data. Returns how many were checked and the
+# mismatches as (input, expected, got).
+def verify(reference, source_dirs = SOURCE_DIRS):
+    times, pairs = time_strings(source_dirs)
+    mismatches = []
+    for time in times:
+        expected = reference(time)
+        try:
+            got = legacy_hours(minutes(time))
+        except ValueError as e:
+            got = e
+        if got != expected:
+            mismatches.append((time, expected, got))
+    for start, end in pairs:
+        expected = round(reference(end) - reference(start), 2)
+        got = legacy_duration(minutes(start), minutes(end))
+        if got != expected:
+            mismatches.append(((start, end), expected, got))
+    return len(times) + len(pairs), mismatches
@@ -0,0 +1,89 @@
+from __future__ import division
+from itertools import product
+import time
+
+import numpy as np
+import cv
+
+# Successive halving over random forest settings, with forests grown by warm start.
+#
+# Every configuration starts with a small forest on each of a few fixed cross-validation
+# splits. After each rung the best 1/eta of the configurations survive and their forests
+# grow eta times larger; warm_start keeps the trees already fitted, so a rung only pays
+# for the new trees. Trees are fitted across all cores (n_jobs = -1). The search stops
+# when one configuration is left, the largest forest size is reached, or the time or
+# tree budget runs out, whichever comes first.
+
+GRID = {
+    "max_features": [1.0, .5, .33],
+    "min_samples_leaf": [1, 2, 5],
+    "max_depth": [None, 20],
+}
+
+
+def configurations(grid = GRID):
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in product(*[grid[name] for name in names])]
+
+
+class Candidate(object):
+
+    def __init__(self, config, splits):
+        from sklearn.ensemble import RandomForestRegressor
+        self.config = config
+        self.forests = [RandomForestRegressor(warm_start = True, n_jobs = -1, random_state = k, **config)
+                        for k in range(len(splits))]
+        self.trees = 0
+        self.error = None
+
+    # Grows every forest to trees trees and rescores; returns the number of trees fitted
+    def grow(self, matrix, targets, splits, trees):
+        errors = []
+        for forest, (train, test) in zip(self.forests, splits):
+            forest.set_params(n_estimators = trees)
+            forest.fit(matrix[train], targets[train])
+            errors.append(np.abs(forest.predict(matrix[test]) - targets[test]).mean())
+        added = (trees - self.trees) * len(splits)
+        self.trees = trees
+        self.error = float(np.mean(errors))
+        return added
+
+
+# Runs the search; returns the leaderboard as (error, trees, config) tuples, best first,
+# each configuration at the largest forest size it reached
+def successive_halving(matrix, targets, grid = GRID, min_trees = 10, max_trees = 270, eta = 3,
+                       num_splits = 3, time_budget = 300, tree_budget = None, verbose = True):
+    targets = np.asarray(targets, dtype = np.float64)
+    splits = cv.splits(len(targets), num_splits)
+    candidates = [Candidate(config, splits) for config in configurations(grid)]
+    alive = list(candidates)
+    start, fitted, trees = time.time(), 0, min_trees
+
+    def out_of_budget():
+        return time.time() - start > time_budget or (tree_budget and fitted >= tree_budget)
+
+    while True:
+        for candidate in alive:
+            fitted += candidate.grow(matrix, targets, splits, trees)
+            if out_of_budget():
+                break
+        scored = sorted((c for c in alive if c.trees == trees), key = lambda c : c.error)
+        if verbose:
+            print "%d trees: %d configurations, best error %.4f (%.0fs)" % (
+                trees, len(scored), scored[0].error, time.time() - start)
+        if out_of_budget() or len(scored) == 1 or trees >= max_trees:
+            break
+        alive = scored[:max(1, len(scored) // eta)]
+        trees = min(trees * eta, max_trees)
+
+    ranked = sorted((c for c in candidates if c.error is not None), key = lambda c : (-c.trees, c.error))
+    return [(c.error, c.trees, c.config) for c in ranked]
+
+
+def report(leaderboard, top = 10):
+    print "===== Random Forest Search Leaderboard (error : trees : settings) =====\n"
+    for error, trees, config in leaderboard[:top]:
+        print "%.4f" % error, trees, config
+    error, trees, config = leaderboard[0]
+    print "\nBest: RandomForestRegressor(n_estimators = %d, %s), error %.4f\n" % (
+        trees, ", ".join("%s = %r" % item for item in sorted(config.items())), error)
@@ -0,0 +1,74 @@
+from multiprocessing import Pool, cpu_count
+import atomic_file
+import hashlib
+import json
+import time
+import os
+
+# Afinn sentiment scores for course summaries, cached on disk by content hash.
+#
+# Most descriptions repeat word for word across terms, so each distinct summary is scored
+# once, ever: later runs (and runs with a new term) only score descriptions they haven't
+# seen. Unseen summaries are scored across a process pool. The cache keeps the most
+# recently used MAX_ENTRIES scores.
+
+CACHE_PATH = ".sentiment_cache.json"
+MAX_ENTRIES = 100000
+
+_afinn = None
+
+
+def summary_hash(summary):
+    return hashlib.sha1(summary.encode("utf-8")).hexdigest()
+
+
+def _score(summary):
+    global _afinn
+    if _afinn is None:
+        from afinn import Afinn
+        _afinn = Afinn()
+    return _afinn.score(summary)
+
+
+def load_cache(path = CACHE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+# Keeps the max_entries most recently used scores and writes the cache atomically
+def save_cache(cache, path = CACHE_PATH, max_entries = MAX_ENTRIES):
+    if len(cache) > max_entries:
+        recent = sorted(cache.items(), key = lambda item : item[1][1], reverse = True)[:max_entries]
+        cache = dict(recent)
+    atomic_file.write_json(path, cache)
+
+
+# Afinn score of each summary, scoring only those missing from the cache
+def score_summaries(summaries, processes = None, path = CACHE_PATH):
+    cache = load_cache(path)
+    now = time.time()
+    hashes = [summary_hash(summary) for summary in summaries]
+
+    unseen = {}
+    for h, summary in zip(hashes, summaries):
+        if h not in cache:
+            unseen[h] = summary
+    if unseen:
+        processes = min(processes or cpu_count(), len(unseen))
+        if processes > 1:
+            pool = Pool(processes)
+            try:
+                scores = pool.map(_score, unseen.values(), chunksize = 64)
+            finally:
+                pool.close()
+        else:
+            scores = map(_score, unseen.values())
+        for h, score in zip(unseen.keys(), scores):
+            cache[h] = [score, now]
+
+    for h in set(hashes):
+        cache[h][1] = now
+    save_cache(cache, path)
+    return [cache[h][0] for h in hashes]
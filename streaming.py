@@ -0,0 +1,154 @@
+from __future__ import division
+from collections import OrderedDict
+import os
+import time
+
+import numpy as np
+import course_store
+import instrument
+import loader
+from course_table import CourseTable
+from features import FeaturePipeline
+from prof_index import ProfIndex
+
+# Out-of-core training: term files are streamed one at a time as mini-batches.
+#
+# Nothing grows with the number of terms. Categorical fields are hashed into a fixed
+# number of indicator columns (no vocabulary to collect first). Start, duration and the
+# RateMyProfessors rating and count are standardised with running statistics, updated
+# from each term before it is scaled. The models are incremental learners fitted with
+# partial_fit, and only one term's courses are in memory at a time. One term is held out
+# and scored at the end. Optionally, the in-memory random forest is trained on the same
+# terms for comparison.
+
+HASH_FEATURES = 2 ** 14
+
+
+def term_files(source_dir):
+    return sorted(course_store.source_files(source_dir))
+
+
+def _term_name(path):
+    return os.path.basename(path)[len("course_data_"):-len(".json")]
+
+
+class StreamingFeatures(object):
+
+    def __init__(self, profs, num_features = HASH_FEATURES):
+        from sklearn.feature_extraction import FeatureHasher
+        from sklearn.preprocessing import StandardScaler
+        self.prof_index = ProfIndex(profs)
+        self.hasher = FeatureHasher(num_features, input_type = "string", alternate_sign = False)
+        self.scaler = StandardScaler()
+
+    def _ratings(self, faculty):
+        rated = [self.prof_index.resolve(name) or (None, None, 0, 0) for name in faculty]
+        return np.array([[prof[2], prof[3]] for prof in rated], dtype = np.float64)
+
+    # (numeric columns, hashed categorical columns) for course_columns output
+    def _split(self, columns):
+        numeric = np.column_stack([np.asarray(columns["start"], dtype = np.float64),
+                                   np.asarray(columns["duration"], dtype = np.float64),
+                                   self._ratings(columns["faculty"])])
+        tokens = [["department=" + dep, "title=" + title, "faculty=" + faculty, "start=%r" % start]
+                  + ["distro=" + distro for distro in distros]
+                  for dep, title, faculty, start, distros in zip(columns["department"], columns["title"], columns["faculty"],
+                                                                columns["start"], columns["distros"])]
+        return numeric, self.hasher.transform(tokens)
+
+    def _combine(self, numeric, hashed):
+        from scipy import sparse
+        return sparse.hstack([sparse.csr_matrix(self.scaler.transform(numeric)), hashed], format = "csr")
+
+    # Updates the running statistics with a batch, then transforms it
+    def partial_fit_transform(self, columns):
+        numeric, hashed = self._split(columns)
+        self.scaler.partial_fit(numeric)
+        return self._combine(numeric, hashed)
+
+    def transform(self, columns):
+        return self._combine(*self._split(columns))
+
+
+def incremental_models():
+    from sklearn.linear_model import SGDRegressor, PassiveAggressiveRegressor
+    from sklearn.neural_network import MLPRegressor
+    return OrderedDict([
+        ("SGD Regressor", SGDRegressor(penalty = "l2", alpha = 1e-4, random_state = 0)),
+        ("Passive Aggressive", PassiveAggressiveRegressor(C = .01, random_state = 0)),
+        ("Multilayer Perceptron", MLPRegressor(hidden_layer_sizes = (50,), random_state = 0)),
+    ])
+
+
+# Streams every term in source_dir except holdout (the last term by default) through the
+# incremental models for epochs passes, then scores the held-out term. columns_of turns a
+# CourseTable into course_columns output. Returns a dict of the run's statistics.
+def train(source_dir, profs, columns_of, holdout = None, epochs = 1, models = None, compare = False):
+    paths = term_files(source_dir)
+    holdout = holdout or _term_name(paths[-1])
+    if holdout not in [_term_name(path) for path in paths]:
+        raise ValueError("no term %s to hold out (terms are %s)" % (holdout, ", ".join(_term_name(path) for path in paths)))
+    training = [path for path in paths if _term_name(path) != holdout]
+    holdout_path = [path for path in paths if _term_name(path) == holdout][0]
+    models = models or incremental_models()
+    features = StreamingFeatures(profs)
+
+    peak, start, seen, largest = instrument.peak_resident_bytes(), time.time(), 0, 0
+    for epoch in range(epochs):
+        for path in training:
+            term_courses, term_targets, _ = loader.load_term(path)
+            if not len(term_courses):
+                continue
+            columns = columns_of(term_courses)
+            # Running statistics only need the first pass
+            matrix = features.partial_fit_transform(columns) if epoch == 0 else features.transform(columns)
+            for model in models.values():
+                model.partial_fit(matrix, term_targets)
+            seen += len(term_courses)
+            largest = max(largest, len(term_courses))
+    elapsed = time.time() - start
+
+    test_courses, test_targets, _ = loader.load_term(holdout_path)
+    test_columns = columns_of(test_courses)
+    test_matrix = features.transform(test_columns)
+    errors = OrderedDict((name, float(np.abs(model.predict(test_matrix) - test_targets).mean()))
+                         for name, model in models.items())
+    result = {"holdout": holdout, "terms": len(training), "epochs": epochs, "courses": seen,
+              "seconds": elapsed, "courses_per_second": seen / elapsed if elapsed else float("inf"),
+              "largest_batch": largest, "peak_bytes_added": instrument.growth(peak, instrument.peak_resident_bytes()), "errors": errors}
+    if compare:
+        result["forest_error"] = forest_error(training, profs, columns_of, test_columns, test_targets)
+    return result
+
+
+# Absolute error on the held-out term of the in-memory random forest, trained on every
+# training term at once
+def forest_error(training, profs, columns_of, test_columns, test_targets):
+    from sklearn.ensemble import RandomForestRegressor
+    table, targets = CourseTable(), []
+    for path in training:
+        term_courses, term_targets, _ = loader.load_term(path)
+        table.extend(term_courses)
+        targets.extend(term_targets.tolist())
+    prof_index = ProfIndex(profs)
+    def ratings(faculty):
+        return {name : prof_index.resolve(name)[2:] for name in set(faculty) if prof_index.resolve(name) is not None}
+    columns = columns_of(table)
+    pipeline = FeaturePipeline()
+    matrix = pipeline.fit_transform(columns, ratings(columns["faculty"]))
+    forest = RandomForestRegressor(n_estimators = 50, n_jobs = -1, random_state = 0).fit(matrix, targets)
+    predictions = forest.predict(pipeline.transform(test_columns, ratings(test_columns["faculty"])))
+    return float(np.abs(predictions - test_targets).mean())
+
+
+def report(result):
+    print "===== Streaming Training (held out %s) =====\n" % result["holdout"]
+    print "%d terms x %d epochs, %d courses in %.2fs: %.0f courses/sec" % (
+        result["terms"], result["epochs"], result["courses"], result["seconds"], result["courses_per_second"])
+    print "Largest batch: %d courses, peak resident memory added: %s MB\n" % (
+        result["largest_batch"], instrument.megabytes(result["peak_bytes_added"]))
+    for name, error in result["errors"].items():
+        print "%-24s mean absolute error %.4f" % (name, error)
+    if "forest_error" in result:
+        print "%-24s mean absolute error %.4f" % ("In-memory random forest", result["forest_error"])
+    print
@@ -0,0 +1,178 @@
+from __future__ import division
+from cgi import escape
+from collections import defaultdict, OrderedDict
+import argparse
+import io
+import json
+import os
+import random
+
+# Synthetic Enroll data for benchmarks, resampled from the real term files.
+#
+# A dataset at scale s has s times as many term files as the real data. Each synthetic
+# term copies a random real term course by course, so departments, distros, meeting
+# times, summaries and the share of courses the loader drops all keep their real
+# frequencies. On top of that, fill rates are jittered, and a share of the faculty and
+# titles are swapped for synthetic ones. Those come from pools that grow with scale, so
+# the number of distinct professors and courses grows the way it would with more history.
+# Faculty names are recombined from real first and last names, and a matching
+# RatingsData.json rates a share of them, so professor matching does realistic work.
+# write_pages renders terms as Enroll subject pages for the scraper benchmarks.
+
+PAST_TERMS = "Carleton Data - Past Terms"
+RATINGS = "RatingsData.json"
+NEW_FACULTY = .3
+NEW_TITLE = .2
+RATED = .15
+
+
+def real_terms(source_dir = PAST_TERMS):
+    terms = []
+    for name in sorted(os.listdir(source_dir)):
+        if name.endswith(".json"):
+            with open(os.path.join(source_dir, name)) as f:
+                terms.append(json.load(f)["course_info"])
+    return terms
+
+
+class Generator(object):
+
+    def __init__(self, scale, seed = 0, source_dir = PAST_TERMS, ratings_path = RATINGS):
+        self.random = random.Random(seed)
+        self.terms = real_terms(source_dir)
+        with open(ratings_path) as f:
+            self.ratings = json.load(f)["ratings"]
+        names = [course["faculty"].strip().split() for term in self.terms for course in term
+                 if course.get("faculty", "n/a") not in ("n/a", "") and "," not in course["faculty"]]
+        self.first_names = sorted({name[0] for name in names if len(name) > 1})
+        self.last_names = sorted({name[-1] for name in names if len(name) > 1})
+        # Synthetic faculty and titles per department; the pools' size limit grows with scale
+        self.pool_size = max(1, int(scale * 40))
+        self.faculty = defaultdict(list)
+        self.titles = defaultdict(list)
+
+    def _synthetic_faculty(self, department):
+        pool = self.faculty[department]
+        if len(pool) < self.pool_size and (not pool or self.random.random() < .5):
+            pool.append("\n%s %s %s" % (self.random.choice(self.first_names),
+                                         chr(ord("A") + self.random.randrange(26)), self.random.choice(self.last_names)))
+        return self.random.choice(pool)
+
+    def _synthetic_title(self, department, title):
+        pool = self.titles[department]
+        if len(pool) < self.pool_size and (not pool or self.random.random() < .5):
+            pool.append("%s: Topics %d" % (title.rstrip(), len(pool) + 1))
+        return self.random.choice(pool)
+
+    def course(self, real, term):
+        course = dict(real, term = term)
+        department = course.get("department", "")
+        if course.get("faculty", "n/a") != "n/a" and self.random.random() < NEW_FACULTY:
+            course["faculty"] = self._synthetic_faculty(department)
+        if "title" in course and self.random.random() < NEW_TITLE:
+            course["title"] = self._synthetic_title(department, course["title"])
+        try:
+            size = int(course["size"])
+            registered = int(course["registered"])
+        except (KeyError, ValueError):
+            return course
+        if size > 0:
+            fill = max(0.0, registered / size + self.random.gauss(0, .1))
+            course["registered"] = str(int(round(fill * size)))
+        return course
+
+    def term(self, index):
+        name = "S%d" % index
+        return name, [self.course(real, name) for real in self.random.choice(self.terms)]
+
+    # RateMyProfessors entries for a share of the synthetic faculty, plus the real ones
+    def ratings_data(self):
+        ratings = list(self.ratings)
+        for pool in self.faculty.values():
+            for faculty in pool:
+                if self.random.random() < RATED:
+                    first, _, last = faculty.split()
+                    prof = dict(self.random.choice(self.ratings))
+                    prof["teacherfirstname_t"], prof["teacherlastname_t"] = first, last
+                    ratings.append(prof)
+        return {"ratings": ratings}
+
+
+# Writes a dataset at scale into directory: one course_data_S<n>.json per synthetic term
+# under PAST_TERMS and a RatingsData.json, laid out like the repository root
+def generate(scale, directory, seed = 0):
+    generator = Generator(scale, seed)
+    term_dir = os.path.join(directory, PAST_TERMS)
+    if not os.path.isdir(term_dir):
+        os.makedirs(term_dir)
+    num_terms = int(round(scale * len(generator.terms)))
+    for index in range(num_terms):
+        name, term_courses = generator.term(index)
+        with open(os.path.join(term_dir, "course_data_%s.json" % name), "w") as f:
+            json.dump({"course_info": term_courses}, f)
+    with open(os.path.join(directory, RATINGS), "w") as f:
+        json.dump(generator.ratings_data(), f)
+    return num_terms
+
+
+# Renders term files as Enroll pages in directory: the homepage listing terms and subjects,
+# and one <term>_<subject>.html for every term and subject, as bench.serve_pages expects.
+# A subject with no courses in a term gets an empty listing, as Enroll shows.
+def write_pages(term_paths, directory):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    terms = OrderedDict()
+    for path in term_paths:
+        with open(path) as f:
+            term_courses = json.load(f)["course_info"]
+        by_department = defaultdict(list)
+        for course in term_courses:
+            by_department[course["department"]].append(course)
+        terms[os.path.basename(path)[len("course_data_"):-len(".json")]] = by_department
+    subjects = sorted(set(department for by_department in terms.values() for department in by_department))
+    for term, by_department in terms.items():
+        for department in subjects:
+            parts = [u'<html><head><title>Enroll</title></head><body><div id="courses">']
+            for course in by_department.get(department, []):
+                parts.append(render_course(course))
+            parts.append(u'</div></body></html>')
+            with io.open(os.path.join(directory, "%s_%s.html" % (term, department)), "w", encoding = "utf-8") as f:
+                f.write(u"".join(parts))
+    options = u"".join(u'<option value="%s">%s</option>' % (term, term) for term in terms)
+    subject_options = u"".join(u"<option>Subject (%s)</option>" % subject for subject in subjects)
+    with io.open(os.path.join(directory, "index.html"), "w", encoding = "utf-8") as f:
+        f.write(u'<html><body><select id="termElement">%s</select><select id="subjectElement"><option>Select</option>%s</select></body></html>'
+                % (options, subject_options))
+
+
+# One div.course as Enroll lays it out, for the fields the course has
+def render_course(course):
+    html = u'<div class="course"><h3 class="title"><span class="coursenum">%s</span>%s<span class="credits">%s</span></h3>' % (
+        escape(course["course_num"]), escape(course.get("title", "")), escape(course.get("credits", "6 credits")))
+    if course.get("start_time", "n/a") != "n/a":
+        html += u'<div class="schedule"><span class="start">%s</span>-<span class="end">%s</span></div>' % (course["start_time"], course["end_time"])
+    if course.get("registered", "n/a") != "n/a":
+        html += u'<span class="status">Registered: %s, Size: %s, Waitlist: 0</span>' % (course["registered"], course["size"])
+    if course.get("faculty", "n/a") != "n/a":
+        html += u'<div class="description"><p class="faculty">%s</p>%s</div>' % (escape(course["faculty"]), course.get("summary", ""))
+    if "requirements_met" in course:
+        html += u'<div class="codes overlays">%s</div>' % escape(course["requirements_met"])
+    return html + u"</div>"
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Generate synthetic Enroll term files for benchmarks")
+    parser.add_argument("scale", type = float, help = "number of terms relative to the real data, e.g. 10")
+    parser.add_argument("directory")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--pages", type = int, default = 0, help = "also render this many terms as Enroll pages")
+    args = parser.parse_args()
+    num_terms = generate(args.scale, args.directory, args.seed)
+    print "Wrote", num_terms, "terms to", args.directory
+    if args.pages:
+        term_dir = os.path.join(args.directory, PAST_TERMS)
+        paths = [os.path.join(term_dir, "course_data_S%d.json" % i) for i in range(min(args.pages, num_terms))]
+        write_pages(paths, os.path.join(args.directory, "pages"))
+
+if __name__ == "__main__":
+    main()